@@ -2,11 +2,27 @@
 
 import discord
 from discord.ext import commands
-from utils.permissions import add_perms, remove_perms, get_perms
+from utils.permissions import add_perms, remove_perms, get_perms, get_permission_table
+from utils.fileio import run_io
 
 class AdminCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.permissions = get_permission_table()
+
+    # Memoized permission decisions depend on roles; /setperms add and remove drop them all when they write
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        if before.roles != after.roles:
+            self.permissions.forget_member(after.guild.id, after.id)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        self.permissions.forget_member(member.guild.id, member.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        self.permissions.forget_all()
 
     @commands.hybrid_group(name="setperms", description="Manage command permissions.")
     @commands.has_permissions(manage_guild=True)
@@ -27,7 +43,7 @@ class AdminCommands(commands.Cog):
         if f"cogs.{cog}" not in self.bot.extensions:
             return await ctx.send(f"❌ The cog `{cog}` is not currently loaded.", ephemeral=not isinstance(ctx, commands.Context))
 
-        add_perms(cog, roles, users)
+        await add_perms(cog, roles, users)
         await ctx.send(f"✅ Added to `{cog}`:\n- **Roles:** {len(roles)}\n- **Users:** {len(users)}",
                        ephemeral=not isinstance(ctx, commands.Context))
 
@@ -44,7 +60,7 @@ class AdminCommands(commands.Cog):
         if f"cogs.{cog}" not in self.bot.extensions:
             return await ctx.send(f"❌ The cog `{cog}` is not currently loaded.", ephemeral=not isinstance(ctx, commands.Context))
 
-        remove_perms(cog, roles, users)
+        await remove_perms(cog, roles, users)
         await ctx.send(f"🗑️ Removed from `{cog}`:\n- **Roles:** {len(roles)}\n- **Users:** {len(users)}",
                        ephemeral=not isinstance(ctx, commands.Context))
 
@@ -53,7 +69,7 @@ class AdminCommands(commands.Cog):
     async def show(self, ctx: commands.Context, cog: str):
         if f"cogs.{cog}" not in self.bot.extensions:
             return await ctx.send(f"❌ The cog `{cog}` is not currently loaded.", ephemeral=not isinstance(ctx, commands.Context))
-        data = get_perms(cog)
+        data = await run_io(get_perms, cog)
         guild = ctx.guild
         roles = [guild.get_role(rid) for rid in data["roles"]]
         users = [guild.get_member(uid) for uid in data["users"]]
@@ -4,41 +4,37 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 from typing import Optional, List
-import json
-import os
 from datetime import datetime
 from utils.permissions import *
+from utils.fileio import JsonFile
 
 AFK_FILE = "./data/afk.json"
 AFK_CONFIG_FILE = "./data/afk_config.json"
 
-def load_afk():
-    try:
-        with open(AFK_FILE, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
+afk_file = JsonFile(AFK_FILE, {}, indent=4)
+config_file = JsonFile(AFK_CONFIG_FILE, {"ignored_channels": [], "ignored_categories": []}, indent=4)
 
-def save_afk(data):
-    with open(AFK_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+async def load_afk():
+    return await afk_file.read()
 
-def load_config():
-    try:
-        with open(AFK_CONFIG_FILE, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {"ignored_channels": [], "ignored_categories": []}
+async def save_afk(data):
+    await afk_file.save(data)
 
-def save_config(config):
-    with open(AFK_CONFIG_FILE, "w") as f:
-        json.dump(config, f, indent=4)
+async def load_config():
+    return await config_file.read()
+
+async def save_config(config):
+    await config_file.save(config)
 
 class AFKManager(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.afk_users = load_afk()
-        self.config = load_config()
+        self.afk_users = {}
+        self.config = {"ignored_channels": [], "ignored_categories": []}
+
+    async def cog_load(self):
+        self.afk_users = await load_afk()
+        self.config = await load_config()
 
     @commands.hybrid_command(name="afk", description="Set AFK for yourself or another user")
     @app_commands.describe(user="User to set AFK (optional)", reason="Reason for AFK (optional)")
@@ -63,7 +59,7 @@ class AFKManager(commands.Cog):
             "time": datetime.utcnow().isoformat(),
             "original_nick": original_nick
         }
-        save_afk(self.afk_users)
+        await save_afk(self.afk_users)
 
         if ctx.author == member:
             await ctx.send(f"✅ {member.mention}, you are now AFK. Reason: `{reason}`")
@@ -89,7 +85,7 @@ class AFKManager(commands.Cog):
             if category.id not in self.config["ignored_categories"]:
                 self.config["ignored_categories"].append(category.id)
 
-        save_config(self.config)
+        await save_config(self.config)
         await ctx.send("✅ AFK ignore configuration updated.")
 
     @afk_config.command(name="remove")
@@ -105,7 +101,7 @@ class AFKManager(commands.Cog):
             if category.id in self.config["ignored_categories"]:
                 self.config["ignored_categories"].remove(category.id)
 
-        save_config(self.config)
+        await save_config(self.config)
         await ctx.send("🗑️ AFK ignore configuration updated.")
 
     @commands.Cog.listener()
@@ -126,7 +122,7 @@ class AFKManager(commands.Cog):
             except Exception:
                 pass
             del self.afk_users[user_id]
-            save_afk(self.afk_users)
+            await save_afk(self.afk_users)
             try:
                 await message.channel.send(f"Welcome back, {message.author.mention}! Your AFK status has been removed.")
             except Exception:
@@ -1,108 +1,77 @@
 # cogs/autoreminder.py
 
+import asyncio
 import discord
 from discord.ext import commands, tasks
-import json
-from datetime import datetime, timedelta
-import os
 from utils.permissions import user_has_permission
+from utils.storage import get_repository
+from utils.records import now_epoch
+from utils.outbox import get_outbox, notification_ref
 
-INVOICES_FILE = "./data/invoices.json"  
-LOGS_FILE = "./data/logs.json"          
 LOG_CHANNEL_ID = 1336384115959791728    
 
-def load_invoices():
-    try:
-        with open(INVOICES_FILE, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
-
-def save_invoices(data):
-    with open(INVOICES_FILE, "w") as f:
-        json.dump(data, f, indent=4)
-
-def load_logs():
-    try:
-        with open(LOGS_FILE, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
-
-def save_logs(data):
-    with open(LOGS_FILE, "w") as f:
-        json.dump(data, f, indent=4)
-
 class AutoReminderCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.repo = get_repository()
+        self.outbox = get_outbox()
+
+    async def cog_load(self):
+        await self.repo.load()
+        await self.outbox.load()
         self.auto_reminder_loop.start()
 
     def cog_unload(self):
         self.auto_reminder_loop.cancel()
 
-    @tasks.loop(minutes=1)
+    @tasks.loop()
     async def auto_reminder_loop(self):
-        now = datetime.utcnow()
-        invoices = load_invoices()  
-        logs = load_logs()          
-        updated = False
-        remaining_invoices = []
-
-        for invoice in invoices:
-            try:
-                reminder_str = invoice.get("reminder")
-                reminder_time = datetime.strptime(reminder_str, "%Y-%m-%d %H:%M:%S")
-            except Exception:
-                remaining_invoices.append(invoice)
-                continue
-
-            if now >= reminder_time:
-                try:
-                    user = await self.bot.fetch_user(int(invoice.get("UserID")))
-                except Exception:
-                    remaining_invoices.append(invoice)
-                    continue
-
-                embed = discord.Embed(
-                    title="⏳ Payment Reminder",
-                    description="This is a reminder for your pending payment. Please complete the payment as soon as possible.",
-                    color=discord.Color.red()
-                )
-                embed.add_field(name="👤 Buyer", value=user.mention, inline=False)
-                embed.add_field(name="🆔 Buyer ID", value=str(invoice.get("UserID")), inline=False)
-                embed.add_field(name="🎮 Buyer In-Game Name", value=invoice.get("ingame_name", "N/A"), inline=False)
-                embed.add_field(name="🛠 Staff Handler", value=f"<@{invoice.get('staff', 'N/A')}>", inline=False)
-                embed.add_field(name="🛒 Service", value=invoice.get("service", "N/A"), inline=False)
-                embed.add_field(name="💰 Amount", value=f"Rs. {invoice.get('amount', 'N/A')}", inline=False)
-                embed.add_field(name="⌛ Payment Date", value=f"<t:{int(reminder_time.timestamp())}:D>", inline=False)
-                embed.add_field(name="⚠ Status", value="**Pending Payment**", inline=False)
-                embed.add_field(
-                    name="📌 Payment Instructions",
-                    value="Please make the payment via UPI and send proof to Modmail.\nIf you forgot the UPI ID, contact Modmail.",
-                    inline=False
-                )
-
-                try:
-                    await user.send(embed=embed)
-                except discord.Forbidden:
-                    pass
-
-                logs.append(invoice)
-                updated = True
-            else:
-                remaining_invoices.append(invoice)
-
-        if updated:
-            save_invoices(remaining_invoices)
-            save_logs(logs)
-            log_channel = self.bot.get_channel(LOG_CHANNEL_ID)
-            embed = discord.Embed(title="📢 Auto reminder was sent and logged", color=discord.Color.green())
-            await log_channel.send(embed=embed)
+        # Sleep until the earliest reminder is due; /invoice pokes the timer so a sooner one is picked up
+        if not await self.repo.reminder_timer.sleep_until(await self.repo.next_reminder()):
+            return
+
+        due = await self.repo.due_invoices(now_epoch())
+        if not due:
+            return
+        # Persist the DMs before archiving, so a failed send or a restart cannot lose a reminder
+        await asyncio.gather(*(
+            self.outbox.enqueue(invoice.user_id, "reminder", notification_ref("reminder", invoice), reminder_embed(invoice).to_dict())
+            for invoice in due
+        ))
+        await self.repo.archive_invoices(due)
+
+        log_channel = self.bot.get_channel(LOG_CHANNEL_ID)
+        embed = discord.Embed(
+            title="📢 Auto reminder was sent and logged",
+            description=f"{len(due)} reminder(s) queued for delivery. See `/outbox` for their status.",
+            color=discord.Color.green()
+        )
+        await log_channel.send(embed=embed)
 
     @auto_reminder_loop.before_loop
     async def before_auto_reminder(self):
         await self.bot.wait_until_ready()
 
+def reminder_embed(invoice):
+    embed = discord.Embed(
+        title="⏳ Payment Reminder",
+        description="This is a reminder for your pending payment. Please complete the payment as soon as possible.",
+        color=discord.Color.red()
+    )
+    embed.add_field(name="👤 Buyer", value=f"<@{invoice.user_id}>", inline=False)
+    embed.add_field(name="🆔 Buyer ID", value=str(invoice.user_id), inline=False)
+    embed.add_field(name="🎮 Buyer In-Game Name", value=invoice.ingame_name or "N/A", inline=False)
+    embed.add_field(name="🛠 Staff Handler", value=f"<@{invoice.staff or 'N/A'}>", inline=False)
+    embed.add_field(name="🛒 Service", value=invoice.service or "N/A", inline=False)
+    embed.add_field(name="💰 Amount", value=f"Rs. {invoice.amount if invoice.amount is not None else 'N/A'}", inline=False)
+    embed.add_field(name="⌛ Payment Date", value=f"<t:{invoice.remind_at}:D>", inline=False)
+    embed.add_field(name="⚠ Status", value="**Pending Payment**", inline=False)
+    embed.add_field(
+        name="📌 Payment Instructions",
+        value="Please make the payment via UPI and send proof to Modmail.\nIf you forgot the UPI ID, contact Modmail.",
+        inline=False
+    )
+    return embed
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(AutoReminderCog(bot))
@@ -14,6 +14,7 @@ import string
 import os
 import time
 from utils.permissions import user_has_permission
+from utils.fileio import run_io
 
 db_config = {
     "host": "",
@@ -29,12 +30,19 @@ class GenerateCode(commands.Cog):
         self.bot = bot
         self.used_codes_file = "used_codes.txt"
         self.used_codes = set()
+
+    async def cog_load(self):
+        self.used_codes = await run_io(self.read_used_codes)
+
+    def read_used_codes(self):
+        codes = set()
         if os.path.exists(self.used_codes_file):
             with open(self.used_codes_file, "r") as f:
                 for line in f:
                     code = line.strip()
                     if code:
-                        self.used_codes.add(code)
+                        codes.add(code)
+        return codes
 
     def save_code(self, code: str):
         """Save generated code to a file and update the in-memory set."""
@@ -144,7 +152,7 @@ class GenerateCode(commands.Cog):
             return await ctx.send(embed=embed, ephemeral=True if ctx.interaction else False)
 
         user_id = str(interaction.user.id)
-        uuid = self.retrieve_user_data(user_id)
+        uuid = await run_io(self.retrieve_user_data, user_id)
         if not uuid:
             await interaction.response.send_message(
                 "You are not linked. Please link your account by doing `/discordsrv link` in-game and sending the code to <#1330846088864731146>.",
@@ -152,7 +160,7 @@ class GenerateCode(commands.Cog):
             )
             return
 
-        redeem_code = self.send_to_rcx_api(uuid)
+        redeem_code = await run_io(self.send_to_rcx_api, uuid)
         if not redeem_code:
             await interaction.response.send_message(
                 "Failed to generate code via RCX API. Please try again later.",
@@ -160,9 +168,9 @@ class GenerateCode(commands.Cog):
             )
             return
 
-        self.save_code(redeem_code)
+        await run_io(self.save_code, redeem_code)
 
-        shortened_url = self.generate_atglinks_url(redeem_code)
+        shortened_url = await run_io(self.generate_atglinks_url, redeem_code)
         if not shortened_url:
             await interaction.response.send_message(
                 "Failed to generate shortened URL. Please try again later.",
@@ -1,24 +1,26 @@
 # cogs/coininvoice.py
 
-import json
-import os
-from datetime import datetime
 import discord
 from discord.ext import commands
 from discord import app_commands
 from utils.permissions import user_has_permission
+from utils.storage import get_repository
+from utils.records import CoinInvoice, format_epoch, now_epoch
+from utils.outbox import get_outbox, notification_ref, DMS_CLOSED
 
-COINS_INVOICE = "./data/coin_invoices.json"
 INVOICES_ROLE = 1337080845718126673 
 LOG_CHANNEL_ID = 1336384115959791728 
-
-if not os.path.exists(COINS_INVOICE):
-    with open(COINS_INVOICE, "w") as f:
-        json.dump([], f)
+DM_WAIT = 5  # seconds to wait for the first delivery attempt before reporting closed DMs
 
 class CoinInvoiceCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.repo = get_repository()
+        self.outbox = get_outbox()
+
+    async def cog_load(self):
+        await self.repo.load()
+        await self.outbox.load()
 
     @app_commands.command(name="coininvoice", description="Create a coin invoice for a player.")
     @app_commands.describe(
@@ -42,25 +44,22 @@ class CoinInvoiceCog(commands.Cog):
 
         nr_amount = coin_amount / 10
         discounted_nr = nr_amount * ((100 - discount) / 100)
-        date_of_purchase = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        purchased_at = now_epoch()
+        date_of_purchase = format_epoch(purchased_at)
 
-        invoice_entry = {
-            "UserID": player.id,
-            "Username": player.name,
-            "InGameName": ingame_name,
-            "Coins": coin_amount,
-            "INR_Equivalent": nr_amount,
-            "Discount": discount,
-            "Final_INR_Amount": discounted_nr,
-            "DateOfPurchase": date_of_purchase,
-            "StaffHandler": interaction.user.id
-        }
+        invoice_entry = CoinInvoice(
+            user_id=player.id,
+            username=player.name,
+            ingame_name=ingame_name,
+            coins=coin_amount,
+            inr_amount=nr_amount,
+            discount=discount,
+            final_amount=discounted_nr,
+            purchased_at=purchased_at,
+            staff=interaction.user.id
+        )
 
-        with open(COINS_INVOICE, "r") as f:
-            invoices = json.load(f)
-        invoices.append(invoice_entry)
-        with open(COINS_INVOICE, "w") as f:
-            json.dump(invoices, f, indent=4)
+        await self.repo.add_coin_invoice(invoice_entry)
 
         embed = discord.Embed(title="📝 Coin Invoice", color=discord.Color.gold())
         embed.add_field(name="👤 Player", value=f"{player.mention} ({player.name})", inline=True)
@@ -75,9 +74,8 @@ class CoinInvoiceCog(commands.Cog):
 
         await interaction.response.send_message("✅ **Invoice generated successfully!**", ephemeral=False)
 
-        try:
-            await player.send(embed=embed)
-        except discord.Forbidden:
+        notification = await self.outbox.enqueue(player.id, "coin invoice", notification_ref("coin invoice", invoice_entry), embed.to_dict())
+        if await self.outbox.wait_attempt(notification, DM_WAIT) == DMS_CLOSED:
             await interaction.followup.send(f"⚠ {player.mention} has DMs closed. Unable to send invoice.", ephemeral=True)
         log_channel = self.bot.get_channel(LOG_CHANNEL_ID)
         if log_channel:
@@ -3,13 +3,11 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import json
-from datetime import datetime, timedelta
-import os
 from configs import INVOICE_CHANNEL_ID  
 from utils.permissions import user_has_permission
-
-INVOICES_FILE = "./data/invoices.json"
+from utils.storage import get_repository
+from utils.records import Invoice, format_epoch, now_epoch
+from utils.outbox import get_outbox, notification_ref, SENT, DMS_CLOSED
 
 product_prices = {
     "celestia": 199,
@@ -19,21 +17,17 @@ product_prices = {
 }
 
 LOG_CHANNEL_ID = INVOICE_CHANNEL_ID  
-
-def load_invoices():
-    try:
-        with open(INVOICES_FILE, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
-
-def save_invoices(data):
-    with open(INVOICES_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
+DM_WAIT = 5  # seconds to wait for the first delivery attempt before replying
 
 class InvoiceCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.repo = get_repository()
+        self.outbox = get_outbox()
+
+    async def cog_load(self):
+        await self.repo.load()
+        await self.outbox.load()
 
     @app_commands.command(name="invoice", description="Generate an invoice for a user")
     @app_commands.describe(
@@ -68,7 +62,8 @@ class InvoiceCog(commands.Cog):
             await interaction.response.send_message("❌ Invalid duration format! Use 'd' for days, 'h' for hours, or 'm' for minutes.", ephemeral=True)
             return
 
-        expiration_time = datetime.utcnow() + timedelta(days=duration_days)
+        generated_at = now_epoch()
+        expires_at = generated_at + int(duration_days * 86400)
 
         try:
             if reminder_time.endswith('d'):
@@ -83,10 +78,10 @@ class InvoiceCog(commands.Cog):
             await interaction.response.send_message("❌ Invalid reminder time format! Use 'd' for days, 'h' for hours, or 'm' for minutes.", ephemeral=True)
             return
 
-        reminder_time_final = expiration_time - timedelta(days=reminder_offset)
-        expiration_timestamp = f"<t:{int(expiration_time.timestamp())}:R>"
-        reminder_timestamp = f"<t:{int(reminder_time_final.timestamp())}:R>"
-        invoice_gen_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        remind_at = expires_at - int(reminder_offset * 86400)
+        expiration_timestamp = f"<t:{expires_at}:R>"
+        reminder_timestamp = f"<t:{remind_at}:R>"
+        invoice_gen_time = format_epoch(generated_at)
 
         embed = discord.Embed(
             title="📜 Payment Invoice",
@@ -105,30 +100,40 @@ class InvoiceCog(commands.Cog):
         embed.add_field(name="📄 Proof", value=f"[Attachment]({attachment.url})", inline=False)
         embed.set_footer(text="Thank you for your purchase! Contact support for any issues.")
 
-        invoices = load_invoices()
-        new_invoice = {
-            "UserID": buyer.id,
-            "service": service_value.capitalize(),
-            "amount": amount,
-            "expiration": expiration_time.strftime("%Y-%m-%d %H:%M:%S"),
-            "reminder": reminder_time_final.strftime("%Y-%m-%d %H:%M:%S"),
-            "ingame_name": in_game_name,
-            "staff": str(interaction.user.id),
-            "proof": attachment.url,
-            "invoice_generated": invoice_gen_time
-        }
-        invoices.append(new_invoice)
-        save_invoices(invoices)
+        new_invoice = Invoice(
+            user_id=buyer.id,
+            service=service_value.capitalize(),
+            amount=amount,
+            ingame_name=in_game_name,
+            staff=interaction.user.id,
+            proof=attachment.url,
+            generated_at=generated_at,
+            expires_at=expires_at,
+            remind_at=remind_at
+        )
+        # A double-submitted command (same staff, buyer, service and proof file) gets the invoice already made
+        idempotency_key = f"{interaction.user.id}:{buyer.id}:{service_value}:{attachment.filename}:{attachment.size}"
+        new_invoice, created = await self.repo.add_invoice(new_invoice, idempotency_key)
+        if not created:
+            await interaction.response.send_message(
+                f"⚠️ This invoice was already generated for {buyer.mention} (Invoice ID `{new_invoice.id}`).", ephemeral=True
+            )
+            return
+        embed.add_field(name="🧾 Invoice ID", value=f"`{new_invoice.id}`", inline=False)
 
         invoice_channel = self.bot.get_channel(INVOICE_CHANNEL_ID)
         await invoice_channel.send(embed=embed)
 
-        try:
-            await interaction.response.defer(ephemeral=True)
-            await buyer.send(embed=embed)
+        await interaction.response.defer(ephemeral=True)
+        # Delivered by the outbox workers, which retry transient failures
+        notification = await self.outbox.enqueue(buyer.id, "invoice", notification_ref("invoice", new_invoice), embed.to_dict())
+        status = await self.outbox.wait_attempt(notification, DM_WAIT)
+        if status == SENT:
             await interaction.followup.send(f"✅ Invoice sent to {buyer.mention} via DM!", ephemeral=True)
-        except discord.Forbidden:
+        elif status == DMS_CLOSED:
             await interaction.followup.send(f"⚠️ Could not DM {buyer.mention}. They might have DMs disabled!", ephemeral=True)
+        else:
+            await interaction.followup.send(f"📨 Invoice DM to {buyer.mention} is queued and will be retried (see `/outbox`).", ephemeral=True)
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(InvoiceCog(bot))
@@ -1,10 +1,19 @@
 import discord
 from discord.ext import commands, tasks
 from typing import Optional
-import re, json, os
-from datetime import datetime, timedelta
+import asyncio
+import re
+import time
+from utils.dispatch import dispatch
+from utils.fileio import JsonFile
+from utils.scheduler import DueQueue, DueTimer
 
 LOCK_LOG_PATH = './data/lock_log.json'
+LOCK_WORKERS = 5  # channel overwrites edited at once by lock, unlock and expiry
+PROGRESS_INTERVAL = 2  # seconds between progress message edits during bulk lock/unlock
+GUILD_RETRY = 60  # seconds before retrying an expiry whose guild is unavailable
+UNLOCK_RETRY = 60  # seconds before retrying an expiry whose unlock failed
+UNLOCK_ATTEMPTS = 5  # failed unlocks before a timed lock is given up on
 
 
 def parse_time(timestr: str) -> Optional[int]:
@@ -24,90 +33,199 @@ def parse_time(timestr: str) -> Optional[int]:
     return None
 
 
-def load_locks():
-    if not os.path.exists(LOCK_LOG_PATH):
-        return {}
-    with open(LOCK_LOG_PATH, 'r') as f:
-        return json.load(f)
+lock_file = JsonFile(LOCK_LOG_PATH, {}, indent=4)
 
 
-def save_locks(data):
-    with open(LOCK_LOG_PATH, 'w') as f:
-        json.dump(data, f, indent=4)
+async def load_locks():
+    return await lock_file.read()
+
+
+async def save_locks(data):
+    await lock_file.save(data)
 
 
 class LockdownCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.locks = load_locks()
+        self.locks = {}
+        self.expiries = DueQueue(key=None)  # (guild id, channel id) queued on their unlock epoch
+        self.timer = DueTimer()
+        self.failures = {}  # (guild id, channel id) -> failed unlocks so far
+
+    async def cog_load(self):
+        self.locks = await load_locks()
+        self.expiries = DueQueue(
+            ((expire, (gid, cid)) for gid, channels in self.locks.items() for cid, expire in channels.items()),
+            key=None
+        )
         self.check_unlocks.start()
 
     def cog_unload(self):
         self.check_unlocks.cancel()
 
-    @tasks.loop(seconds=30)
+    @tasks.loop()
     async def check_unlocks(self):
-        now = datetime.utcnow().timestamp()
-        to_remove = []
-        for gid, channels in self.locks.items():
-            for cid, expire in channels.items():
-                if expire and now > expire:
-                    guild = self.bot.get_guild(int(gid))
-                    if not guild:
-                        continue
-                    channel = guild.get_channel(int(cid))
-                    if channel:
-                        await channel.set_permissions(guild.default_role, send_messages=None)
-                    to_remove.append((gid, cid))
-
-        for gid, cid in to_remove:
-            self.locks[gid].pop(cid, None)
-            if not self.locks[gid]:
-                self.locks.pop(gid)
-        if to_remove:
-            save_locks(self.locks)
+        # Sleep until the earliest timed lock expires; _add_locks pokes the timer
+        if not await self.timer.sleep_until(self.expiries.next_due()):
+            return
+
+        due = self.expiries.due(time.time())
+        report, results = await dispatch(due, self._expire, LOCK_WORKERS)
+        for gid, cid in results.get("guild unavailable", []):
+            self.expiries.push(time.time() + GUILD_RETRY, (gid, cid))
+        for gid, cid in results.get("unlocked", []) + results.get("channel gone", []):
+            self._forget(gid, cid)
+        for gid, cid in results.get("forbidden", []):
+            print(f"Missing permissions to unlock channel {cid} in guild {gid}; dropping its timed lock")
+            self._forget(gid, cid)
+        for (gid, cid), error in report.errors:
+            # Transient failures (5xx, network) stay in the lock log and are retried, up to UNLOCK_ATTEMPTS
+            failures = self.failures.get((gid, cid), 0) + 1
+            if failures >= UNLOCK_ATTEMPTS:
+                print(f"Failed to unlock channel {cid} in guild {gid} {failures} times, giving up: {error}")
+                self._forget(gid, cid)
+            else:
+                print(f"Failed to unlock channel {cid} in guild {gid}, retrying in {UNLOCK_RETRY}s: {error}")
+                self.failures[(gid, cid)] = failures
+                self.expiries.push(time.time() + UNLOCK_RETRY, (gid, cid))
+        await save_locks(self.locks)
+
+    async def _expire(self, key):
+        gid, cid = key
+        guild = self.bot.get_guild(int(gid))
+        if not guild:
+            return "guild unavailable"
+        channel = guild.get_channel(int(cid))
+        if not channel:
+            return "channel gone"
+        try:
+            await channel.set_permissions(guild.default_role, send_messages=None)
+        except discord.NotFound:
+            return "channel gone"
+        except discord.Forbidden:
+            return "forbidden"
+        return "unlocked"
+
+    @check_unlocks.before_loop
+    async def before_check_unlocks(self):
+        await self.bot.wait_until_ready()
+
+    def _forget(self, gid, cid):
+        self.expiries.discard((gid, cid))
+        self.failures.pop((gid, cid), None)
+        self.locks.get(gid, {}).pop(cid, None)
+        if gid in self.locks and not self.locks[gid]:
+            self.locks.pop(gid)
+
+    async def _targets(self, ctx, target, args):
+        """Resolve `server`, `category <category>` or a list of channels; returns (channels, label, rest of args)."""
+        if target == "server":
+            return list(ctx.guild.text_channels), "all channels", args
+        if target == "category":
+            if not args:
+                raise commands.BadArgument("Name the category to target.")
+            category = await commands.CategoryChannelConverter().convert(ctx, args[0])
+            return list(category.text_channels), f"all channels in **{category.name}**", args[1:]
+        if not target:
+            return [ctx.channel], ctx.channel.mention, args
+        words = [target, *args]
+        channels = []
+        while words:
+            try:
+                channels.append(await commands.TextChannelConverter().convert(ctx, words[0]))
+            except commands.BadArgument:
+                if not channels:
+                    raise
+                break
+            words.pop(0)
+        label = channels[0].mention if len(channels) == 1 else f"{len(channels)} channels"
+        return channels, label, words
+
+    async def _bulk_set(self, ctx, channels, send_messages, verb):
+        """Apply the @everyone send_messages overwrite to channels, LOCK_WORKERS at a time.
+
+        Rate limits are handled by dispatch(). With more than one channel, a
+        separate ticker edits a progress message every PROGRESS_INTERVAL
+        seconds, so a failed edit never changes a channel's outcome.
+        Returns (report, channels that succeeded).
+        """
+        progress = await ctx.send(f"⏳ {verb.capitalize()} 0/{len(channels)} channels...") if len(channels) > 1 else None
+        done = 0
+
+        async def apply(channel):
+            nonlocal done
+            await channel.set_permissions(ctx.guild.default_role, send_messages=send_messages)
+            done += 1
+            return verb
+
+        async def tick():
+            while True:
+                await asyncio.sleep(PROGRESS_INTERVAL)
+                try:
+                    await progress.edit(content=f"⏳ {verb.capitalize()} {done}/{len(channels)} channels...")
+                except discord.HTTPException:
+                    return
+
+        ticker = asyncio.ensure_future(tick()) if progress else None
+        try:
+            report, results = await dispatch(channels, apply, LOCK_WORKERS)
+        finally:
+            if ticker:
+                ticker.cancel()
+        if progress:
+            try:
+                await progress.delete()
+            except discord.HTTPException:
+                pass
+        return report, results.get(verb, [])
+
+    def _result(self, report, emoji, message):
+        if report.total > 1:
+            message += f" ({report.summary()})"
+        if report.errors:
+            failed = ", ".join(channel.mention for channel, _error in report.errors[:10])
+            message += f"\n⚠️ Failed on {len(report.errors)} channel(s): {failed}"
+        return f"{emoji} {message}"
 
     @commands.command(name="lock")
     @commands.has_permissions(manage_channels=True)
-    async def lock(self, ctx, target: Optional[str] = None, duration: Optional[str] = None):
-        if target == "server":
-            seconds = parse_time(duration) if duration else None
-            for channel in ctx.guild.text_channels:
-                await channel.set_permissions(ctx.guild.default_role, send_messages=False)
-                if seconds:
-                    self._add_lock(ctx.guild.id, channel.id, seconds)
-            await ctx.send(f"🔒 Locked all channels{' for ' + duration if duration else ' indefinitely'}.")
-        else:
-            channel = ctx.channel if not target else await commands.TextChannelConverter().convert(ctx, target)
-            seconds = parse_time(duration) if duration else None
-            await channel.set_permissions(ctx.guild.default_role, send_messages=False)
-            if seconds:
-                self._add_lock(ctx.guild.id, channel.id, seconds)
-            await ctx.send(f"🔒 Locked {channel.mention}{' for ' + duration if duration else ' indefinitely'}.")
+    async def lock(self, ctx, target: Optional[str] = None, *args: str):
+        channels, label, rest = await self._targets(ctx, target, args)
+        if len(rest) > 1:
+            raise commands.BadArgument(f'Channel "{rest[0]}" not found.')
+        duration = rest[0] if rest else None
+        seconds = parse_time(duration) if duration else None
+        report, locked = await self._bulk_set(ctx, channels, False, "locked")
+        if seconds:
+            await self._add_locks(ctx.guild.id, [channel.id for channel in locked], seconds)
+        await ctx.send(self._result(report, "🔒", f"Locked {label}{' for ' + duration if seconds else ' indefinitely'}."))
 
     @commands.command(name="unlock")
     @commands.has_permissions(manage_channels=True)
-    async def unlock(self, ctx, target: Optional[str] = None):
-        if target == "server":
-            for channel in ctx.guild.text_channels:
-                await channel.set_permissions(ctx.guild.default_role, send_messages=None)
-            self.locks.pop(str(ctx.guild.id), None)
-            await ctx.send("🔓 Unlocked all channels.")
-        else:
-            channel = ctx.channel if not target else await commands.TextChannelConverter().convert(ctx, target)
-            await channel.set_permissions(ctx.guild.default_role, send_messages=None)
-            self.locks.get(str(ctx.guild.id), {}).pop(str(channel.id), None)
-            await ctx.send(f"🔓 Unlocked {channel.mention}.")
-            save_locks(self.locks)
-
-    def _add_lock(self, guild_id, channel_id, seconds):
-        gid, cid = str(guild_id), str(channel_id)
-        expire_time = datetime.utcnow().timestamp() + seconds
-        if gid not in self.locks:
-            self.locks[gid] = {}
-        self.locks[gid][cid] = expire_time
-        save_locks(self.locks)
-
+    async def unlock(self, ctx, target: Optional[str] = None, *args: str):
+        channels, label, rest = await self._targets(ctx, target, args)
+        if rest:
+            raise commands.BadArgument(f'Channel "{rest[0]}" not found.')
+        report, unlocked = await self._bulk_set(ctx, channels, None, "unlocked")
+        gid = str(ctx.guild.id)
+        # `unlock server` also drops timed locks on channels that no longer exist
+        cids = list(self.locks.get(gid, {})) if target == "server" else [str(channel.id) for channel in unlocked]
+        for cid in cids:
+            self._forget(gid, cid)
+        await save_locks(self.locks)
+        await ctx.send(self._result(report, "🔓", f"Unlocked {label}."))
+
+    async def _add_locks(self, guild_id, channel_ids, seconds):
+        """Record timed locks for channel_ids and save the lock table once."""
+        gid = str(guild_id)
+        expire_time = time.time() + seconds
+        for channel_id in channel_ids:
+            cid = str(channel_id)
+            self.locks.setdefault(gid, {})[cid] = expire_time
+            self.expiries.push(expire_time, (gid, cid))
+            self.failures.pop((gid, cid), None)
+        self.timer.poke()
+        await save_locks(self.locks)
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(LockdownCog(bot))
\ No newline at end of file
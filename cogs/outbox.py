@@ -0,0 +1,121 @@
+# cogs/outbox.py
+
+import discord
+from discord.ext import commands, tasks
+from typing import Literal, Optional
+import configs
+from utils.dispatch import dispatch
+from utils.outbox import get_outbox, record_ref, SENT, DMS_CLOSED, DEAD, PENDING, RECORD_KINDS, RETENTION
+from utils.records import now_epoch
+from utils.users import get_user_resolver
+
+LOG_CHANNEL_ID = 1336384115959791728
+OUTBOX_WORKERS = getattr(configs, "OUTBOX_WORKERS", 4)  # DMs in flight at once
+
+
+class OutboxCog(commands.Cog):
+    """Delivers queued invoice and reminder DMs, retrying failures with backoff."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.outbox = get_outbox()
+        self.users = get_user_resolver(bot)
+        self.last_report = None
+
+    async def cog_load(self):
+        await self.outbox.load()
+        self.deliver_loop.start()
+
+    def cog_unload(self):
+        self.deliver_loop.cancel()
+
+    @tasks.loop()
+    async def deliver_loop(self):
+        # Sleep until the next notification is due; enqueue() pokes the timer
+        if not await self.outbox.timer.sleep_until(self.outbox.next_due()):
+            return
+
+        report, results = await dispatch(self.outbox.due(now_epoch()), self.deliver, OUTBOX_WORKERS)
+        self.last_report = report
+        # Still rate limited after dispatch's retries: back these off like any other failure
+        for notification, error in report.errors:
+            await self.outbox.record_attempt(notification, None, error)
+        await self.outbox.prune()
+
+        dead = results.get(DEAD, [])
+        log_channel = self.bot.get_channel(LOG_CHANNEL_ID)
+        if dead and log_channel:
+            embed = discord.Embed(
+                title="📪 DMs dead-lettered",
+                description=f"{len(dead)} DM(s) gave up after repeated failures. Use `/outbox retry` to try again.\nBatch: {report.summary()}",
+                color=discord.Color.orange()
+            )
+            await log_channel.send(embed=embed)
+
+    async def deliver(self, notification):
+        """Attempt one DM and record the outcome; returns the notification's status afterwards."""
+        try:
+            user = await self.users.fetch_user(notification.user_id)
+            await user.send(embed=discord.Embed.from_dict(notification.embed))
+        except discord.Forbidden:
+            return await self.outbox.record_attempt(notification, DMS_CLOSED)
+        except discord.NotFound as exc:
+            return await self.outbox.record_attempt(notification, DEAD, exc)
+        except Exception as exc:
+            if getattr(exc, "retry_after", None) is not None:
+                raise  # dispatch pauses every worker and retries it
+            status = await self.outbox.record_attempt(notification, None, exc)
+            return "retrying" if status == PENDING else status
+        return await self.outbox.record_attempt(notification, SENT)
+
+    @deliver_loop.before_loop
+    async def before_deliver(self):
+        await self.bot.wait_until_ready()
+
+    @commands.hybrid_command(name="outbox", description="Show queued DM delivery status, or retry dead-lettered DMs")
+    @commands.has_permissions(manage_guild=True)
+    async def outbox_command(self, ctx: commands.Context, action: Literal["status", "retry"] = "status", invoice_id: Optional[str] = None):
+        if action == "retry":
+            count = await self.outbox.retry_dead()
+            await ctx.send(f"🔁 Re-queued {count} dead-lettered DM(s).", ephemeral=True)
+            return
+
+        if invoice_id is not None:
+            await ctx.send(embed=self.invoice_status(invoice_id.strip()), ephemeral=True)
+            return
+
+        counts = self.outbox.counts()
+        embed = discord.Embed(title="📬 DM Outbox", color=discord.Color.blurple())
+        for status in (PENDING, SENT, DMS_CLOSED, DEAD):
+            embed.add_field(name=status.capitalize(), value=f"`{counts.get(status, 0)}`", inline=True)
+        if self.last_report is not None:
+            embed.add_field(name="Last Batch", value=self.last_report.summary(), inline=False)
+        dead = self.outbox.dead_letters(5)
+        if dead:
+            embed.add_field(
+                name="Recent Dead Letters",
+                value="\n".join(f"`{n.kind}` to <@{n.user_id}> after {n.attempts} attempts: {(n.last_error or 'unknown error')[:100]}" for n in dead),
+                inline=False
+            )
+        await ctx.send(embed=embed, ephemeral=True)
+
+    def invoice_status(self, invoice_id):
+        """Embed with the delivery status of each DM sent about one invoice or coin invoice."""
+        embed = discord.Embed(title=f"📬 DMs for Invoice `{invoice_id}`", color=discord.Color.blurple())
+        for kind in RECORD_KINDS:
+            notification = self.outbox.get(record_ref(kind, invoice_id))
+            if notification is None:
+                continue
+            value = f"**{self.outbox.status(notification.ref).capitalize()}** after {notification.attempts} attempt(s)"
+            if notification.status == PENDING:
+                value += f", next attempt <t:{int(notification.next_attempt_at)}:R>"
+            if notification.last_error:
+                value += f"\nLast error: {notification.last_error[:100]}"
+            embed.add_field(name=kind.capitalize(), value=value, inline=False)
+        if not embed.fields:
+            embed.description = f"No DMs on record. Delivered DMs are kept for {RETENTION // 86400} days."
+        return embed
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(OutboxCog(bot))
@@ -1,43 +1,27 @@
 # cogs/reminder.py
 
-import json
-import os
-from datetime import datetime, timedelta
+from datetime import timedelta
 import discord
 from discord.ext import commands
 from discord import app_commands
 from utils.permissions import user_has_permission
+from utils.storage import get_repository
+from utils.records import LogEntry, now_epoch
+from utils.outbox import get_outbox, SENT, DMS_CLOSED
 
-LOGS_FILE = './data/logs.json'
-INVOICES_FILE = './data/invoices.json'
 LOG_CHANNEL_ID = 1336384115959791728 
 ALLOWED_ROLE_ID = 1337080845718126673    
-
-def load_invoices():
-    try:
-        with open(INVOICES_FILE, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
-
-def save_invoices(data):
-    with open(INVOICES_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
-
-def load_logs():
-    try:
-        with open(LOGS_FILE, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
-
-def save_logs(data):
-    with open(LOGS_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
+DM_WAIT = 2  # seconds to wait for the first delivery attempt before replying
 
 class ReminderCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.repo = get_repository()
+        self.outbox = get_outbox()
+
+    async def cog_load(self):
+        await self.repo.load()
+        await self.outbox.load()
 
     @app_commands.command(name="reminder", description="Manually send a payment reminder to a user")
     @app_commands.describe(
@@ -46,10 +30,11 @@ class ReminderCog(commands.Cog):
         staff="Staff member handling the payment (mention them)",
         service="Service name",
         amount="Amount in Rs.",
-        expiration="Expiration time (e.g., 1d, 2h, 30m)"
+        expiration="Expiration time (e.g., 1d, 2h, 30m)",
+        invoice_id="Invoice ID from the invoice embed, to close exactly that invoice"
     )
     @app_commands.checks.has_role(ALLOWED_ROLE_ID)
-    async def reminder(self, interaction: discord.Interaction, buyer: discord.Member, ingame_name: str, staff: discord.Member, service: str, amount: int, expiration: str):
+    async def reminder(self, interaction: discord.Interaction, buyer: discord.Member, ingame_name: str, staff: discord.Member, service: str, amount: int, expiration: str, invoice_id: str = None):
         time_units = {"d": "days", "h": "hours", "m": "minutes"}
         try:
             num = int(expiration[:-1])
@@ -57,27 +42,21 @@ class ReminderCog(commands.Cog):
             if unit not in time_units:
                 raise ValueError
             delta = timedelta(**{time_units[unit]: num})
-            expiration_time = datetime.now() + delta
-            expiration_timestamp = int(expiration_time.timestamp())
+            expiration_timestamp = now_epoch() + int(delta.total_seconds())
         except (ValueError, TypeError):
             await interaction.response.send_message("❌ Invalid expiration format. Use `1d`, `2h`, `30m` etc.", ephemeral=True)
             return
 
-        invoices = load_invoices()
-
-        found_invoice = None
-        remaining_invoices = []
-        for inv in invoices:
-            if (inv.get("UserID") == buyer.id and 
-                inv.get("service").lower() == service.lower() and 
-                inv.get("ingame_name").lower() == ingame_name.lower() and 
-                inv.get("amount") == amount):
-                found_invoice = inv
-            else:
-                remaining_invoices.append(inv)
-
-        if found_invoice:
-            save_invoices(remaining_invoices)
+        if invoice_id is not None:
+            invoice = await self.repo.get_invoice(int(invoice_id)) if invoice_id.strip().isdigit() else None
+            if invoice is None or invoice.user_id != buyer.id:
+                await interaction.response.send_message(f"❌ No open invoice `{invoice_id}` for {buyer.mention}.", ephemeral=True)
+                return
+            matches = [invoice]
+        else:
+            matches = await self.repo.find_invoices(buyer.id, service, ingame_name, amount)
+        found_invoice = matches[-1] if matches else None
+        await self.repo.remove_invoices(matches)
 
         embed = discord.Embed(
             title="⏳ Manual Payment Reminder",
@@ -98,11 +77,19 @@ class ReminderCog(commands.Cog):
             inline=False
         )
 
-        try:
-            await buyer.send(embed=embed)
-            await interaction.response.send_message(f"✅ Reminder sent to {buyer.mention} via DM!", ephemeral=True)
-        except discord.Forbidden:
-            await interaction.response.send_message(f"⚠️ Could not DM {buyer.mention}. They might have DMs disabled!", ephemeral=True)
+        reminded_at = now_epoch()
+        await interaction.response.defer(ephemeral=True)
+        # Delivered by the outbox workers, which retry transient failures
+        notification = await self.outbox.enqueue(
+            buyer.id, "manual reminder", f"manual reminder:{buyer.id}:{reminded_at}:{service}", embed.to_dict()
+        )
+        status = await self.outbox.wait_attempt(notification, DM_WAIT)
+        if status == SENT:
+            await interaction.followup.send(f"✅ Reminder sent to {buyer.mention} via DM!", ephemeral=True)
+        elif status == DMS_CLOSED:
+            await interaction.followup.send(f"⚠️ Could not DM {buyer.mention}. They might have DMs disabled!", ephemeral=True)
+        else:
+            await interaction.followup.send(f"📨 Reminder DM to {buyer.mention} is queued and will be retried (see `/outbox`).", ephemeral=True)
 
 
         log_channel = self.bot.get_channel(LOG_CHANNEL_ID)
@@ -112,21 +99,19 @@ class ReminderCog(commands.Cog):
         )
         await log_channel.send(embed=log_embed)
 
-        purchase_date = found_invoice.get("invoice_generated") if found_invoice and found_invoice.get("invoice_generated") else datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = {
-            "UserID": buyer.id,
-            "service": service,
-            "amount": amount,
-            "expiration": expiration_time.strftime("%Y-%m-%d %H:%M:%S"),
-            "ingame_name": ingame_name,
-            "staff": str(staff.id),
-            "status": "Manual Reminder Sent",
-            "reminder_generated": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
-            "purchase_date": purchase_date
-        }
-        logs = load_logs()  
-        logs.append(log_entry)
-        save_logs(logs)
+        purchase_date = found_invoice.generated_at if found_invoice and found_invoice.generated_at else reminded_at
+        log_entry = LogEntry(
+            user_id=buyer.id,
+            service=service,
+            amount=amount,
+            expires_at=expiration_timestamp,
+            ingame_name=ingame_name,
+            staff=staff.id,
+            status="Manual Reminder Sent",
+            reminded_at=reminded_at,
+            purchased_at=purchase_date
+        )
+        await self.repo.add_log(log_entry)
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(ReminderCog(bot))
@@ -3,46 +3,130 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from datetime import datetime, timedelta
-import json
-from typing import Optional
+from typing import Literal, Optional
+import asyncio
+import calendar
+import heapq
+import itertools
+import re
+import tempfile
+import time
 from utils.permissions import user_has_permission
+from utils.storage import get_repository
+from utils.records import format_epoch, now_epoch
+from utils.rollups import ACTIVE, LOGGED, COINS, sale_of
+from utils.analytics import SalesFrame, moving_average
+from utils.fileio import run_io
+from utils.timeindex import group_sales
+from utils.cache import ResultCache, DATASETS
+from utils.export import ExportWriter, export_rows
+from utils.users import get_user_resolver
+
+REPORT_ROWS = 20  # rows shown by /salereport and /sale group_by
+RESULT_CACHE_SIZE = 256  # /sale, /history and /services results kept between calls
+TREND_WINDOW = 3  # months in the /salereport trend moving average
+
+MONTH_NAMES = {
+    "january": 1, "february": 2, "march": 3, "april": 4,
+    "may": 5, "june": 6, "july": 7, "august": 8,
+    "september": 9, "october": 10, "november": 11, "december": 12
+}
+LAST_UNITS = {"d": 86400, "h": 3600}
+WITHIN_UNITS = {"d": 86400, "h": 3600, "m": 60}
+RELATIVE_GRAIN = 60  # seconds "last 30d" and "within 3d" bounds are rounded down to, so repeats share a cache entry
+
+
+def parse_sale_query(query):
+    """Resolve a /sale query to (title, start, end, rollup), or None if it is not understood.
+
+    start/end are UTC epoch bounds ([start, end), None = open). rollup is the
+    (year, month) filter when the rollup counters can answer the query alone.
+    """
+    query = query.lower().strip()
+    if query == "lifetime":
+        return "Lifetime Sales Stats", None, None, (None, None)
+    if query.isdigit():
+        year = int(query)
+        if not 1 <= year < 9999:
+            return None
+        return f"Sales Stats for {year}", calendar.timegm((year, 1, 1, 0, 0, 0)), calendar.timegm((year + 1, 1, 1, 0, 0, 0)), (year, None)
+    if query in MONTH_NAMES:
+        return f"Sales Stats for {query.capitalize()} (all years)", None, None, (None, MONTH_NAMES[query])
+
+    match = re.fullmatch(r"([a-z]+)\s+(\d{1,4})", query)
+    if match and match.group(1) in MONTH_NAMES and int(match.group(2)) >= 1:
+        month, year = MONTH_NAMES[match.group(1)], int(match.group(2))
+        end = (year + 1, 1) if month == 12 else (year, month + 1)
+        return (
+            f"Sales Stats for {match.group(1).capitalize()} {year}",
+            calendar.timegm((year, month, 1, 0, 0, 0)), calendar.timegm(end + (1, 0, 0, 0)), None
+        )
 
-# File paths
-INVOICES_FILE = "./data/invoices.json"           
-COINS_INVOICES_FILE = "./data/coin_invoices.json"  
-LOGS_FILE = "./data/logs.json"                     
-
-# Helper functions to load data
-def load_invoices():
-    try:
-        with open(INVOICES_FILE, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
-
-def load_coins_invoices():
-    try:
-        with open(COINS_INVOICES_FILE, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
-
-def load_logs():
-    try:
-        with open(LOGS_FILE, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
+    match = re.fullmatch(r"last\s*(\d+)\s*([dh])", query)
+    if match:
+        span = int(match.group(1)) * LAST_UNITS[match.group(2)]
+        start = (now_epoch() - span) // RELATIVE_GRAIN * RELATIVE_GRAIN
+        return f"Sales Stats for the last {match.group(1)}{match.group(2)}", start, None, None
+
+    match = re.fullmatch(r"(\d{4}-\d{2}-\d{2})\s*\.\.\s*(\d{4}-\d{2}-\d{2})", query)
+    if match:
+        try:
+            start = calendar.timegm(time.strptime(match.group(1), "%Y-%m-%d"))
+            end = calendar.timegm(time.strptime(match.group(2), "%Y-%m-%d")) + 86400
+        except ValueError:
+            return None
+        if end <= start:
+            return None
+        return f"Sales Stats for {match.group(1)} to {match.group(2)}", start, end, None
+    return None
+
+
+def format_rupees(amount):
+    """Rs. amount with thousands separators, and paise only when there are any."""
+    amount = amount or 0
+    return f"Rs. {amount:,.0f}" if float(amount).is_integer() else f"Rs. {amount:,.2f}"
+
+
+def format_table(header, rows):
+    """Fixed-width code block for an embed; columns are capped at 18 characters."""
+    widths = [min(max(len(str(row[i])) for row in [header] + rows), 18) for i in range(len(header))]
+    lines = [" | ".join(f"{str(cell)[:widths[i]]:<{widths[i]}}" for i, cell in enumerate(row)) for row in [header] + rows]
+    lines.insert(1, "-" * len(lines[0]))
+    return "```" + "\n".join(lines) + "```"
 
 class StatsCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.repo = get_repository()
+        self.cache = ResultCache(RESULT_CACHE_SIZE)
+
+    async def cog_load(self):
+        await self.repo.load()
+
+    async def cached(self, key, datasets, compute):
+        """Return compute()'s result for key, reusing it until one of the datasets is written."""
+        # Snapshot before computing: a write that lands meanwhile makes the stored entry stale, not wrong
+        versions = self.repo.versions.snapshot(datasets)
+        hit, value = self.cache.get(key, versions)
+        if not hit:
+            value = await compute()
+            self.cache.put(key, versions, value)
+        return value
+
+    async def sales_frame(self):
+        """Every sale as a SalesFrame, rebuilt only after one of the datasets is written."""
+        async def build():
+            # Building the column arrays is the only per-record pass; keep it off the loop
+            return await run_io(SalesFrame, await self.repo.sales())
+        return await self.cached(("salesframe",), DATASETS, build)
 
     # /sale command (hybrid)
-    @commands.hybrid_command(name="sale", description="Show sales stats by month, year, or lifetime")
-    @app_commands.describe(query="Enter a month (e.g. january), a year (e.g. 2025), or 'lifetime'")
-    async def sale(self, ctx: commands.Context, query: str):
+    @commands.hybrid_command(name="sale", description="Show sales stats for a month, year, date range or lifetime")
+    @app_commands.describe(
+        query="A month (january, march 2025), a year (2025), a range (2025-01-01..2025-03-31), 'last 30d' or 'lifetime'",
+        group_by="Also break the sales down by service, staff or day"
+    )
+    async def sale(self, ctx: commands.Context, query: str, group_by: Optional[Literal["service", "staff", "day"]] = None):
 
         if not user_has_permission("stats", ctx.author):
             embed = discord.Embed(
@@ -52,80 +136,38 @@ class StatsCog(commands.Cog):
             )
             return await ctx.send(embed=embed, ephemeral=True if ctx.interaction else False)
 
-        query_lower = query.lower().strip()
-        service_invs = load_invoices()   # Active service invoices (with "invoice_generated")
-        service_logs = load_logs()         # Logged service invoices (with "invoice_generated")
-        coins_invs = load_coins_invoices() # Coin invoices (with "DateOfPurchase" and Final_INR_Amount)
-        combined = []
-
-        # Process active service invoices
-        for inv in service_invs:
-            try:
-                dt = datetime.strptime(inv.get("invoice_generated", ""), "%Y-%m-%d %H:%M:%S")
-            except Exception:
-                continue
-            combined.append({
-                "UserID": inv.get("UserID"),
-                "service": inv.get("service"),
-                "amount": inv.get("amount"),
-                "date": dt,
-                "type": "Service Active"
-            })
-
-        # Process logged service invoices
-        for inv in service_logs:
-            try:
-                dt = datetime.strptime(inv.get("invoice_generated", ""), "%Y-%m-%d %H:%M:%S")
-            except Exception:
-                continue
-            combined.append({
-                "UserID": inv.get("UserID"),
-                "service": inv.get("service"),
-                "amount": inv.get("amount"),
-                "date": dt,
-                "type": "Service Logged"
-            })
-
-        # Process coin invoices (using DateOfPurchase and Final_INR_Amount)
-        for inv in coins_invs:
-            try:
-                dt = datetime.strptime(inv.get("DateOfPurchase", ""), "%Y-%m-%d %H:%M:%S")
-            except Exception:
-                continue
-            combined.append({
-                "UserID": inv.get("UserID"),
-                "service": inv.get("service"),
-                "amount": inv.get("Final_INR_Amount"),
-                "date": dt,
-                "type": "Coins"
-            })
-
-        # Filtering based on query
-        if query_lower == "lifetime":
-            filtered = combined
-            title = "Lifetime Sales Stats"
-        elif query_lower.isdigit():
-            year = int(query_lower)
-            filtered = [inv for inv in combined if inv["date"].year == year]
-            title = f"Sales Stats for {year}"
-        else:
-            month_names = {
-                "january": 1, "february": 2, "march": 3, "april": 4,
-                "may": 5, "june": 6, "july": 7, "august": 8,
-                "september": 9, "october": 10, "november": 11, "december": 12
-            }
-            if query_lower not in month_names:
-                await ctx.send("❌ Invalid query. Please enter a valid month name, year, or 'lifetime'.", ephemeral=True)
-                return
-            month = month_names[query_lower]
-            filtered = [inv for inv in combined if inv["date"].month == month]
-            title = f"Sales Stats for {query_lower.capitalize()}"
-
-        total_revenue = sum(inv.get("amount", 0) for inv in filtered)
-        total_invoices = len(filtered)
-        service_count = sum(1 for inv in filtered if "Service" in inv["type"])
-        coins_count = sum(1 for inv in filtered if inv["type"] == "Coins")
-        coins_profit = sum(inv.get("amount", 0) for inv in filtered if inv["type"] == "Coins")
+        parsed = parse_sale_query(query)
+        if parsed is None:
+            await ctx.send("❌ Invalid query. Use a month (e.g. `march` or `march 2025`), a year, a range like `2025-01-01..2025-03-31`, `last 30d` or `lifetime`.", ephemeral=True)
+            return
+        title, start, end, rollup = parsed
+
+        if group_by is not None and rollup is not None and rollup[1] is not None:
+            await ctx.send("❌ Add a year to group a month, e.g. `march 2025`.", ephemeral=True)
+            return
+
+        async def compute():
+            if rollup is not None and group_by is None:
+                # Lifetime, a year or a month across years: answered from the rollup counters
+                return await self.repo.sales_summary(year=rollup[0], month=rollup[1]), None
+            # Ranges and group-bys: a bisect slice of the sorted sales time index
+            sales = await self.repo.sales(start, end)
+            summary = {}
+            for kind, _ts, amount, _service, _staff in sales:
+                total = summary.setdefault(kind, [0, 0])
+                total[0] += 1
+                total[1] += amount or 0
+            return summary, group_sales(sales, group_by) if group_by is not None else None
+
+        summary, groups = await self.cached(("sale", start, end, rollup, group_by), DATASETS, compute)
+
+        active_count, active_revenue = summary.get(ACTIVE, (0, 0))
+        logged_count, logged_revenue = summary.get(LOGGED, (0, 0))
+        coins_count, coins_profit = summary.get(COINS, (0, 0))
+
+        service_count = active_count + logged_count
+        total_invoices = service_count + coins_count
+        total_revenue = active_revenue + logged_revenue + coins_profit
         service_revenue = total_revenue - coins_profit
 
         embed = discord.Embed(title=f"**{title}**", color=discord.Color.green())
@@ -135,9 +177,201 @@ class StatsCog(commands.Cog):
         embed.add_field(name="💸 Coins Profit", value=f"`Rs. {coins_profit}`", inline=False)
         embed.add_field(name="📈 Service Revenue", value=f"`Rs. {service_revenue}`", inline=False)
         embed.add_field(name="💰 Total Revenue", value=f"`Rs. {total_revenue}`", inline=False)
-        embed.set_footer(text=f"Data as of <t:{int(datetime.utcnow().timestamp())}:F>")
+        if groups:
+            rows = []
+            for label, count, revenue in groups[:REPORT_ROWS]:
+                if group_by == "staff":
+                    member = ctx.guild.get_member(label) if label else None
+                    label = member.display_name if member else str(label or "Unknown")
+                rows.append((label, count, format_rupees(revenue)))
+            more = f" (first {REPORT_ROWS} of {len(groups)})" if len(groups) > REPORT_ROWS else ""
+            embed.add_field(name=f"By {group_by.capitalize()}{more}", value=format_table((group_by.capitalize(), "Sales", "Revenue"), rows), inline=False)
+        embed.set_footer(text=f"Data as of <t:{now_epoch()}:F>")
         await ctx.send(embed=embed)
 
+    @commands.hybrid_command(name="salereport", description="Break sales down by service, staff, month or a monthly trend")
+    @app_commands.describe(by="How to group the sales", year="Only include sales from this year")
+    async def salereport(self, ctx: commands.Context, by: Literal["service", "staff", "month", "trend"], year: Optional[int] = None):
+        if not user_has_permission("stats", ctx.author):
+            embed = discord.Embed(
+                title="🚫 No Permission",
+                description="You don't have permission to use the command.",
+                color=discord.Color.red()
+            )
+            return await ctx.send(embed=embed, ephemeral=True if ctx.interaction else False)
+
+        start = end = None
+        if year is not None:
+            if not 1 <= year < 9999:
+                return await ctx.send("❌ Invalid year.", ephemeral=True)
+            start = calendar.timegm((year, 1, 1, 0, 0, 0))
+            end = calendar.timegm((year + 1, 1, 1, 0, 0, 0))
+
+        frame = await self.sales_frame()
+        sales = sum(count for _kind, count, _revenue in frame.by_type(start, end))
+        if not sales:
+            return await ctx.send("❌ No sales found for that period.", ephemeral=True)
+
+        if by == "service":
+            header = ("Service", "Sales", "Revenue")
+            rows = [(name, count, format_rupees(revenue)) for name, count, revenue in frame.by_service(start, end)]
+        elif by == "staff":
+            header = ("Staff", "Sales", "Revenue")
+            rows = []
+            for staff_id, count, revenue in frame.by_staff(start, end):
+                member = ctx.guild.get_member(staff_id) if staff_id else None
+                name = member.display_name if member else str(staff_id or "Unknown")
+                rows.append((name, count, format_rupees(revenue)))
+        elif by == "month":
+            header = ("Month", "Sales", "Revenue")
+            rows = [(calendar.month_name[m], count, format_rupees(revenue)) for m, count, revenue in frame.by_month_of_year(start, end) if count]
+        else:
+            labels, revenue = frame.monthly(start, end)
+            averages = moving_average(revenue, TREND_WINDOW)
+            header = ("Month", "Revenue", f"{TREND_WINDOW}-mo avg")
+            rows = [(label, format_rupees(r), format_rupees(round(a))) for label, r, a in zip(labels, revenue, averages)][-REPORT_ROWS:]
+
+        title = f"📊 Sales by {by.capitalize()}" + (f" ({year})" if year is not None else "")
+        embed = discord.Embed(title=title, description=format_table(header, rows[:REPORT_ROWS]), color=discord.Color.green())
+        embed.set_footer(text=f"{sales} sales")
+        await ctx.send(embed=embed)
+
+    @commands.hybrid_command(name="staffstats", description="Staff leaderboard: invoices, revenue, coin sales and reminders for a period")
+    @app_commands.describe(query="A month (march, march 2025), a year, a range (2025-01-01..2025-03-31), 'last 30d' or 'lifetime'")
+    async def staffstats(self, ctx: commands.Context, query: str = "lifetime"):
+        if not user_has_permission("stats", ctx.author):
+            embed = discord.Embed(
+                title="🚫 No Permission",
+                description="You don't have permission to use the command.",
+                color=discord.Color.red()
+            )
+            return await ctx.send(embed=embed, ephemeral=True if ctx.interaction else False)
+
+        parsed = parse_sale_query(query)
+        if parsed is None:
+            await ctx.send("❌ Invalid query. Use a month (e.g. `march` or `march 2025`), a year, a range like `2025-01-01..2025-03-31`, `last 30d` or `lifetime`.", ephemeral=True)
+            return
+        title, start, end, rollup = parsed
+        month = rollup[1] if rollup is not None else None
+
+        # Served from per-day staff counters, never from the raw invoices
+        summary = await self.repo.staff_summary(start, end, month)
+        leaders = sorted(summary.items(), key=lambda item: -(item[1][1] + item[1][3]))
+        leaders = [(staff_id, values) for staff_id, values in leaders if any(values)]
+        if not leaders:
+            await ctx.send("❌ No staff activity found for that period.", ephemeral=True)
+            return
+
+        rows = []
+        for staff_id, (invoices, revenue, coin_sales, coin_revenue, reminders) in leaders[:REPORT_ROWS]:
+            member = ctx.guild.get_member(staff_id) if staff_id else None
+            name = member.display_name if member else str(staff_id or "Unknown")
+            rows.append((name, invoices, format_rupees(revenue), f"{coin_sales} ({format_rupees(coin_revenue)})", reminders))
+
+        embed = discord.Embed(
+            title=f"**{title.replace('Sales Stats', 'Staff Stats')}**",
+            description=format_table(("Staff", "Invoices", "Revenue", "Coins", "Reminders"), rows),
+            color=discord.Color.gold()
+        )
+        embed.set_footer(text=f"Data as of <t:{now_epoch()}:F>")
+        await ctx.send(embed=embed)
+
+    @commands.hybrid_command(name="rebuildsales", description="Recount the /sale and /staffstats counters from every stored invoice")
+    @commands.has_permissions(manage_guild=True)
+    async def rebuildsales(self, ctx: commands.Context):
+        await ctx.defer(ephemeral=True)
+        await self.repo.rebuild_sales()
+        self.cache.clear()  # rollup answers may have changed without a dataset write
+        await ctx.send("✅ Sales and staff statistics rebuilt from the stored invoices.", ephemeral=True)
+
+    @commands.hybrid_command(name="cachestats", description="Show hit/miss counts for the result cache and the user cache")
+    @commands.has_permissions(manage_guild=True)
+    async def cachestats(self, ctx: commands.Context):
+        stats = self.cache.stats()
+        embed = discord.Embed(title="🗃️ Result Cache", color=discord.Color.blurple())
+        embed.add_field(name="Hits", value=f"`{stats['hits']}`", inline=True)
+        embed.add_field(name="Misses", value=f"`{stats['misses']}`", inline=True)
+        embed.add_field(name="Hit Rate", value=f"`{stats['hit_rate']:.1%}`", inline=True)
+        embed.add_field(name="Invalidated", value=f"`{stats['stale']}`", inline=True)
+        embed.add_field(name="Evicted", value=f"`{stats['evictions']}`", inline=True)
+        embed.add_field(name="Entries", value=f"`{stats['size']}/{stats['maxsize']}`", inline=True)
+
+        users = get_user_resolver(self.bot).stats()
+        embed.add_field(
+            name="👤 User Cache",
+            value=(
+                f"Gateway hits: `{users['gateway_hits']}` • Cache hits: `{users['hits']}` • Shared fetches: `{users['coalesced']}`\n"
+                f"REST fetches: `{users['fetches']}` • Failed: `{users['failures']}` • Hit rate: `{users['hit_rate']:.1%}` • Cached: `{users['size']}`"
+            ),
+            inline=False
+        )
+        await ctx.send(embed=embed, ephemeral=True)
+
+
+    @commands.hybrid_command(name="export", description="Export invoices, logs and coin invoices as a CSV or JSONL file")
+    @commands.has_permissions(manage_guild=True)
+    @app_commands.describe(
+        dataset="Which records to export",
+        fmt="File format",
+        period="A year, 'march 2025', a range (2025-01-01..2025-03-31), 'last 30d' or 'lifetime'",
+        user="Only this buyer's records",
+        service="Only this service ('coins' for coin invoices)",
+        compress="Gzip the file"
+    )
+    async def export(
+        self, ctx: commands.Context,
+        dataset: Literal["all", "invoices", "logs", "coins"] = "all",
+        fmt: Literal["csv", "jsonl"] = "csv",
+        period: str = "lifetime",
+        user: Optional[discord.Member] = None,
+        service: Optional[str] = None,
+        compress: bool = False
+    ):
+        parsed = parse_sale_query(period)
+        if parsed is None or parsed[3] is not None and parsed[3][1] is not None:
+            await ctx.send("❌ Invalid period. Use a year, a month with its year (e.g. `march 2025`), a range like `2025-01-01..2025-03-31`, `last 30d` or `lifetime`.", ephemeral=True)
+            return
+        _title, start, end, _rollup = parsed
+        await ctx.defer(ephemeral=True)
+
+        user_id = user.id if user else None
+        service = service.lower().strip() if service else None
+        datasets = DATASETS if dataset == "all" else ("coin_invoices" if dataset == "coins" else dataset,)
+        started = time.perf_counter()
+        out = await run_io(tempfile.TemporaryFile)
+        try:
+            writer = ExportWriter(out, fmt, compress)
+            # One batch at a time: filter, encode and (optionally) gzip it straight into the temp file
+            for name in datasets:
+                async for records in self.repo.stream_records(name, start, end, user_id):
+                    await run_io(writer.write, export_rows(name, records, start, end, user_id, service))
+            await run_io(writer.close)
+            size = await run_io(lambda: out.seek(0, 2))
+            out.seek(0)
+
+            if not writer.rows:
+                await ctx.send("❌ No records match that export.", ephemeral=True)
+                return
+            limit = ctx.guild.filesize_limit if ctx.guild else 8 * 1024 * 1024
+            if size > limit:
+                await ctx.send(f"❌ The export is {size / 1048576:.1f} MB, over this server's {limit / 1048576:.0f} MB upload limit. Narrow the period or filters.", ephemeral=True)
+                return
+            filename = f"export-{dataset}-{now_epoch()}.{fmt}" + (".gz" if compress else "")
+            await ctx.send(
+                f"✅ Exported {writer.rows} records ({size / 1024:.0f} KB) in {time.perf_counter() - started:.1f}s.",
+                file=discord.File(out, filename=filename), ephemeral=True
+            )
+        finally:
+            out.close()
+
+    async def _history_data(self, user_id):
+        # Load invoice data from all sources
+        service_invs, service_logs, coins_invs = await asyncio.gather(
+            self.repo.invoices_for_user(user_id),
+            self.repo.logs_for_user(user_id),
+            self.repo.coin_invoices_for_user(user_id)
+        )
+        return PurchaseHistory(service_invs, service_logs, coins_invs)
 
     @commands.hybrid_command(name="history", description="Retrieve purchase history for a user")
     @commands.has_role(1329709323273900095)
@@ -145,107 +379,66 @@ class StatsCog(commands.Cog):
         user="User to retrieve history for"
     )
     async def history(self, ctx: commands.Context, user: discord.Member):
-        # Load invoice data from all sources
-        service_invs = load_invoices()    
-        service_logs = load_logs()            
-        coins_invs = load_coins_invoices()    
-
-        # Build full history for each category
-        full_history = []
-        active_history = []
-        logged_history = []
-        coins_history = []
-
-        for inv in service_invs:
-            if inv.get("UserID") == user.id:
-                try:
-                    dt = datetime.strptime(inv.get("invoice_generated", ""), "%Y-%m-%d %H:%M:%S")
-                except Exception:
-                    continue
-                entry = {
-                    "service": inv.get("service"),
-                    "amount": inv.get("amount"),
-                    "date": dt.strftime("%Y-%m-%d %H:%M:%S"),
-                    "type": "Service Active",
-                    "invoice_generated": inv.get("invoice_generated", "N/A")
-                }
-                full_history.append(entry)
-                active_history.append(entry)
-
-        for inv in service_logs:
-            if inv.get("UserID") == user.id:
-                try:
-                    dt = datetime.strptime(inv.get("invoice_generated", ""), "%Y-%m-%d %H:%M:%S")
-                except Exception:
-                    continue
-                entry = {
-                    "service": inv.get("service"),
-                    "amount": inv.get("amount"),
-                    "date": dt.strftime("%Y-%m-%d %H:%M:%S"),
-                    "type": "Service Logged",
-                    "invoice_generated": inv.get("invoice_generated", "N/A")
-                }
-                full_history.append(entry)
-                logged_history.append(entry)
-
-        for inv in coins_invs:
-            if inv.get("UserID") == user.id:
-                try:
-                    dt = datetime.strptime(inv.get("DateOfPurchase", ""), "%Y-%m-%d %H:%M:%S")
-                except Exception:
-                    continue
-                entry = {
-                    "service": inv.get("service") if inv.get("service") and inv.get("service").lower() != "none" else "Coins",
-                    "amount": inv.get("Final_INR_Amount"),
-                    "date": dt.strftime("%Y-%m-%d %H:%M:%S"),
-                    "type": "Coins",
-                    "invoice_generated": inv.get("DateOfPurchase", "N/A")
-                }
-                full_history.append(entry)
-                coins_history.append(entry)
-
-        if not full_history:
+        history = await self.cached(("history", user.id), DATASETS, lambda: self._history_data(user.id))
+        if not history.totals["all"]:
             await ctx.send(f"No purchase history found for {user.mention}.", ephemeral=True)
             return
 
-        # Sort each list by date descending
-        def sort_entries(entries):
-            return sorted(entries, key=lambda x: datetime.strptime(x["date"], "%Y-%m-%d %H:%M:%S"), reverse=True)
-        
-        full_history = sort_entries(full_history)
-        active_history = sort_entries(active_history)
-        logged_history = sort_entries(logged_history)
-        coins_history = sort_entries(coins_history)
-
-        # Prepare data dictionary for the view
-        history_data = {
-            "all": full_history,
-            "active": active_history,
-            "logged": logged_history,
-            "coins": coins_history
-        }
-
-        view = HistoryCategoryView(user, history_data, per_page=5)
+        view = HistoryCategoryView(user, history, per_page=5)
         await ctx.send(embed=view.get_embed(), view=view)
 
-    @commands.hybrid_command(name="services", description="List active service invoices with expiry details; optionally filter by service name")
+    @commands.hybrid_command(name="services", description="List active service invoices, soonest expiry first; optionally filter by service name")
     @commands.has_role(1329709323273900095)
-    @app_commands.describe(query="Type 'active' for all, or a specific service name")
-    async def services(self, ctx: commands.Context, query: str):
+    @app_commands.describe(
+        query="Type 'active' for all, or a specific service name",
+        within="Only services expiring within this time (e.g. 3d, 12h)"
+    )
+    async def services(self, ctx: commands.Context, query: str, within: Optional[str] = None):
         query_lower = query.lower().strip()
-        service_invs = load_invoices()
+        service = None if query_lower == "active" else query_lower
+        title = "📋 Active Service Invoices" if service is None else f"📋 Active Invoices for {query_lower.capitalize()}"
+
+        until = None
+        if within is not None:
+            match = re.fullmatch(r"(\d+)\s*([dhm])", within.lower().strip())
+            if not match:
+                await ctx.send("❌ Invalid time format! Use 'd' for days, 'h' for hours, or 'm' for minutes (e.g. 3d).", ephemeral=True)
+                return
+            until = (now_epoch() + int(match.group(1)) * WITHIN_UNITS[match.group(2)]) // RELATIVE_GRAIN * RELATIVE_GRAIN
+            title += f" expiring within {match.group(1)}{match.group(2)}"
 
-        if query_lower == "active":
-            filtered = service_invs
-            title = "📋 Active Service Invoices"
-        else:
-            filtered = [inv for inv in service_invs if inv.get("service", "").lower() == query_lower]
-            title = f"📋 Active Invoices for {query_lower.capitalize()}"
+        async def fetch_page(offset, limit):
+            return await self.cached(
+                ("services", service, until, offset, limit), ("invoices",),
+                lambda: self.repo.expiring_invoices(service, until, offset, limit)
+            )
 
-        if not filtered:
+        view = ServicesView(fetch_page, ctx.guild, title)
+        await view.load_page()
+        if not view.total:
             await ctx.send("❌ No active invoices found for that query.", ephemeral=True)
             return
+        await ctx.send(embed=view.get_embed(), view=view)
+
+
+# Pagination view for /services
+class ServicesView(discord.ui.View):
+    """Pages through active invoices soonest-expiring first, fetching one page per click."""
 
+    def __init__(self, fetch_page, guild: discord.Guild, title: str, per_page=10):
+        super().__init__(timeout=120)
+        self.fetch_page = fetch_page  # async (offset, limit) -> (invoices, total)
+        self.guild = guild
+        self.title = title
+        self.per_page = per_page
+        self.page = 0
+        self.rows = []
+        self.total = 0
+
+    async def load_page(self):
+        self.rows, self.total = await self.fetch_page(self.page * self.per_page, self.per_page)
+
+    def get_embed(self):
         # Column definitions (adjust widths as needed)
         col_user_width = 15
         col_service_width = 10
@@ -262,37 +455,33 @@ class StatsCog(commands.Cog):
         separator = "-" * (col_user_width + col_service_width + col_date_width + col_expire_width + 9)  # +9 for separators/spaces
 
         lines = [header, separator]
+        now = now_epoch()
 
-        for inv in filtered:
-            # 1) Resolve user name
-            uid = str(inv.get("UserID", "N/A"))
-            user_obj = ctx.guild.get_member(int(uid)) if uid.isdigit() else None
-            if user_obj:
-                # Truncate display name if needed
-                user_name = user_obj.display_name
-            else:
-                user_name = uid
+        for inv in self.rows:
+            # 1) Resolve user name (only this page's members are looked up)
+            user_obj = self.guild.get_member(inv.user_id) if inv.user_id else None
+            user_name = user_obj.display_name if user_obj else str(inv.user_id or "N/A")
             if len(user_name) > col_user_width:
                 user_name = user_name[: col_user_width - 2] + ".."  # e.g. "Mr_Jagdish.." if too long
 
             # 2) Service name
-            service_name = inv.get("service", "N/A")
+            service_name = inv.service or "N/A"
             if len(service_name) > col_service_width:
                 service_name = service_name[: col_service_width - 2] + ".."
 
-            # 3) Parse invoice_generated to date + expires in days
-            raw_date = inv.get("invoice_generated", "")
-            try:
-                dt = datetime.strptime(raw_date, "%Y-%m-%d %H:%M:%S")
-                date_str = dt.strftime("%d %b %Y %I:%M %p")  # e.g. "06 Feb 2025 04:09 PM"
-                if len(date_str) > col_date_width:
-                    date_str = date_str[: col_date_width - 2] + ".."
-                expiration_dt = dt + timedelta(days=28)
-                days_remaining = (expiration_dt - datetime.utcnow()).days
-                expires_str = f"{days_remaining}d" if days_remaining >= 0 else "Expired"
-            except Exception:
-                date_str = "N/A"
+            # 3) Generation date + time left until the stored expiry
+            date_str = format_epoch(inv.generated_at, "%d %b %Y %I:%M %p")  # e.g. "06 Feb 2025 04:09 PM"
+            if len(date_str) > col_date_width:
+                date_str = date_str[: col_date_width - 2] + ".."
+            expiry = inv.expiry
+            if expiry is None:
                 expires_str = "N/A"
+            elif expiry <= now:
+                expires_str = "Expired"
+            elif expiry - now >= 86400:
+                expires_str = f"{(expiry - now) // 86400}d"
+            else:
+                expires_str = f"{(expiry - now) // 3600}h"
 
             # 4) Build line with fixed columns
             line = (
@@ -304,79 +493,132 @@ class StatsCog(commands.Cog):
             lines.append(line)
 
         code_block = "```" + "\n".join(lines) + "```"
-        embed = discord.Embed(title=title, description=code_block, color=discord.Color.purple())
-        embed.set_footer(text="Data retrieved from active invoices")
-        await ctx.send(embed=embed)
+        embed = discord.Embed(title=self.title, description=code_block, color=discord.Color.purple())
+        total_pages = (self.total - 1) // self.per_page + 1 if self.total else 1
+        embed.set_footer(text=f"Page {self.page+1}/{total_pages} • {self.total} active invoices")
+        return embed
 
+    async def update_message(self, interaction: discord.Interaction):
+        await self.load_page()
+        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self.page > 0:
+            self.page -= 1
+            await self.update_message(interaction)
+        else:
+            await interaction.response.defer()
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if (self.page + 1) * self.per_page < self.total:
+            self.page += 1
+            await self.update_message(interaction)
+        else:
+            await interaction.response.defer()
+
+
+class PurchaseHistory:
+    """A user's purchases per category, newest first.
+
+    Holds the shared records only; the /history entry for a record is built
+    when a cursor reaches it, and the totals are computed once here.
+    """
+
+    def __init__(self, invoices, logs, coin_invoices):
+        self.records = {
+            category: sorted(
+                (record for record in records if sale_of(kind, record)[0] is not None),
+                key=lambda record, kind=kind: sale_of(kind, record)[0], reverse=True
+            )
+            for category, kind, records in (("active", ACTIVE, invoices), ("logged", LOGGED, logs), ("coins", COINS, coin_invoices))
+        }
+        self.totals = {category: len(records) for category, records in self.records.items()}
+        self.totals["all"] = sum(self.totals.values())
+        self.coins_profit = sum(inv.final_amount or 0 for inv in self.records["coins"])
+
+    def cursor(self, category):
+        """Iterate a category's entries newest first; "all" lazily merges the other three."""
+        kinds = {"active": ACTIVE, "logged": LOGGED, "coins": COINS}
+        streams = [
+            zip(itertools.repeat(kind), self.records[name])
+            for name, kind in kinds.items() if category in ("all", name)
+        ]
+        for kind, record in heapq.merge(*streams, key=lambda item: sale_of(*item)[0], reverse=True):
+            ts, service, amount = sale_of(kind, record)
+            yield {"service": service, "amount": amount, "timestamp": ts, "type": kind}
 
 
 # Pagination view for /history
 class HistoryCategoryView(discord.ui.View):
-    def __init__(self, user: discord.Member, history_data: dict, per_page=5):
+    """Walks a PurchaseHistory with one cursor per category; each page is rendered once."""
+
+    def __init__(self, user: discord.Member, history: PurchaseHistory, per_page=5):
         super().__init__(timeout=120)
         self.user = user
-        self.history_data = history_data  # Dict with keys: all, active, logged, coins
+        self.history = history
         self.per_page = per_page
         self.current_category = "all"
-        self.entries = self.history_data[self.current_category]
         self.page = 0
+        self._cursors = {}  # category -> [entry iterator, pages consumed]
+        self._embeds = {}  # (category, page) -> rendered embed
+
+    def _page_entries(self, category, page):
+        cursor = self._cursors.get(category)
+        if cursor is None or cursor[1] > page:
+            cursor = self._cursors[category] = [self.history.cursor(category), 0]
+        # Skip pages that were never shown, then take this one
+        skip = (page - cursor[1]) * self.per_page
+        entries = list(itertools.islice(cursor[0], skip, skip + self.per_page))
+        cursor[1] = page + 1
+        return entries
 
     def get_embed(self):
+        key = (self.current_category, self.page)
+        if key in self._embeds:
+            return self._embeds[key]
         embed = discord.Embed(
             title=f"Purchase History for {self.user.display_name} ({self.current_category.capitalize()})",
             color=discord.Color.blue()
         )
-        start = self.page * self.per_page
-        end = start + self.per_page
-        for entry in self.entries[start:end]:
-            try:
-                dt = datetime.strptime(entry["date"], "%Y-%m-%d %H:%M:%S")
-                timestamp = int(dt.timestamp())
-                date_formatted = f"<t:{timestamp}:F>"
-            except Exception:
-                date_formatted = entry["date"]
+        for entry in self._page_entries(self.current_category, self.page):
             embed.add_field(
                 name=f"{entry['type']} - {entry['service']}",
-                value=f"Amount: `Rs. {entry['amount']}`\nDate: {date_formatted}\nInvoice: `{entry.get('invoice_generated','N/A')}`",
+                value=f"Amount: `Rs. {entry['amount']}`\nDate: <t:{entry['timestamp']}:F>\nInvoice: `{format_epoch(entry['timestamp'])}`",
                 inline=False
             )
-        total_pages = (len(self.entries) - 1) // self.per_page + 1 if self.entries else 1
+        total = self.history.totals[self.current_category]
+        total_pages = (total - 1) // self.per_page + 1 if total else 1
         embed.set_footer(text=f"Page {self.page+1}/{total_pages}")
         if self.current_category == "coins" and self.page == 0:
-            total_profit = sum(e["amount"] for e in self.entries)
-            embed.add_field(name="Total Coins Profit", value=f"`Rs. {total_profit}`", inline=False)
+            embed.add_field(name="Total Coins Profit", value=f"`Rs. {self.history.coins_profit}`", inline=False)
+        self._embeds[key] = embed
         return embed
 
     async def update_message(self, interaction: discord.Interaction):
         await interaction.response.edit_message(embed=self.get_embed(), view=self)
 
-    @discord.ui.button(label="All", style=discord.ButtonStyle.primary)
-    async def all_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.current_category = "all"
-        self.entries = self.history_data["all"]
+    async def show_category(self, interaction: discord.Interaction, category: str):
+        self.current_category = category
         self.page = 0
         await self.update_message(interaction)
 
+    @discord.ui.button(label="All", style=discord.ButtonStyle.primary)
+    async def all_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_category(interaction, "all")
+
     @discord.ui.button(label="Active", style=discord.ButtonStyle.primary)
     async def active_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.current_category = "active"
-        self.entries = self.history_data["active"]
-        self.page = 0
-        await self.update_message(interaction)
+        await self.show_category(interaction, "active")
 
     @discord.ui.button(label="Logged", style=discord.ButtonStyle.primary)
     async def logged_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.current_category = "logged"
-        self.entries = self.history_data["logged"]
-        self.page = 0
-        await self.update_message(interaction)
+        await self.show_category(interaction, "logged")
 
     @discord.ui.button(label="Coins", style=discord.ButtonStyle.primary)
     async def coins_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.current_category = "coins"
-        self.entries = self.history_data["coins"]
-        self.page = 0
-        await self.update_message(interaction)
+        await self.show_category(interaction, "coins")
 
     @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
     async def previous(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -388,7 +630,7 @@ class HistoryCategoryView(discord.ui.View):
 
     @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
     async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if (self.page + 1) * self.per_page < len(self.entries):
+        if (self.page + 1) * self.per_page < self.history.totals[self.current_category]:
             self.page += 1
             await self.update_message(interaction)
         else:
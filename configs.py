@@ -1,2 +1,4 @@
 BOT_TOKEN = ""
 INVOICE_CHANNEL_ID = 
+STORAGE_BACKEND = "json"  # "json" or "sqlite" (run `python -m utils.sqlite_store` once to import the JSON files)
+OUTBOX_WORKERS = 4  # invoice and reminder DMs sent concurrently (discord.py still waits out each rate-limit bucket)
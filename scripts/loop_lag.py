@@ -0,0 +1,92 @@
+"""
+Measure how long reading and writing a large data file stalls the event loop,
+first with the old inline json.load/json.dump and then through utils.fileio.
+
+    python scripts/loop_lag.py [records]
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.fileio import read_json, write_json
+
+
+def make_records(count):
+    return [
+        {
+            "UserID": 100000000000000000 + i,
+            "service": "Celestia",
+            "amount": 199,
+            "expiration": "2025-03-01 12:00:00",
+            "reminder": "2025-02-28 12:00:00",
+            "ingame_name": f"Player_{i}",
+            "staff": "200000000000000000",
+            "proof": f"https://cdn.discordapp.com/attachments/{i}/proof.png",
+            "invoice_generated": "2025-02-01 12:00:00"
+        }
+        for i in range(count)
+    ]
+
+
+async def max_lag_during(workload, interval=0.001):
+    """Run workload while a ticker records the worst delay past its scheduled wake-up."""
+    worst = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal worst
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            worst = max(worst, time.perf_counter() - start - interval)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(interval * 5)
+    started = time.perf_counter()
+    await workload()
+    elapsed = time.perf_counter() - started
+    done.set()
+    await task
+    return worst, elapsed
+
+
+async def main(count):
+    path = os.path.join(tempfile.mkdtemp(), "invoices.json")
+    data = make_records(count)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4)
+
+    async def inline_read():
+        with open(path, "r") as f:
+            json.load(f)
+
+    async def inline_write():
+        with open(path, "w") as f:
+            json.dump(data, f, indent=4)
+
+    async def pooled_read():
+        await read_json(path, [])
+
+    async def pooled_write():
+        await write_json(path, list(data), indent=4)
+
+    print(f"{count} records, {os.path.getsize(path) / 1e6:.1f} MB on disk")
+    workloads = (
+        ("read, inline json.load", inline_read),
+        ("read, utils.fileio", pooled_read),
+        ("write, inline json.dump", inline_write),
+        ("write, utils.fileio", pooled_write),
+    )
+    for name, workload in workloads:
+        lag, elapsed = await max_lag_during(workload)
+        print(f"{name:<24} max loop lag {lag * 1000:8.1f} ms   (operation took {elapsed * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000))
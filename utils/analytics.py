@@ -0,0 +1,106 @@
+import numpy as np
+from utils.rollups import ACTIVE, LOGGED, COINS
+
+KINDS = (ACTIVE, LOGGED, COINS)
+
+
+class SalesFrame:
+    """Every sale as parallel NumPy columns, sorted by date.
+
+    Columns: epoch seconds, amount, type code (index into KINDS), service
+    code (index into services) and staff id (0 when unknown). Breakdowns
+    are single vectorized passes (bincount / unique) over a date window
+    found with searchsorted, so no per-record Python loop runs per query.
+    """
+
+    def __init__(self, sales):
+        """sales: (type, epoch, amount, service, staff) tuples as returned by repository.sales()."""
+        count = len(sales)
+        services = {}
+        epochs = np.empty(count, dtype=np.int64)
+        amounts = np.empty(count, dtype=np.float64)
+        kinds = np.empty(count, dtype=np.int8)
+        service_codes = np.empty(count, dtype=np.int32)
+        staff = np.empty(count, dtype=np.int64)
+        kind_codes = {kind: code for code, kind in enumerate(KINDS)}
+        for i, (kind, ts, amount, service, staff_id) in enumerate(sales):
+            epochs[i] = ts
+            amounts[i] = amount or 0
+            kinds[i] = kind_codes[kind]
+            service_codes[i] = services.setdefault(service or "Unknown", len(services))
+            staff[i] = staff_id or 0
+
+        order = np.argsort(epochs, kind="stable")
+        self.epochs = epochs[order]
+        self.amounts = amounts[order]
+        self.kinds = kinds[order]
+        self.services = service_codes[order]
+        self.staff = staff[order]
+        self.service_names = list(services)
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def window(self, start=None, end=None):
+        """Slice covering sales dated in [start, end); None bounds are open."""
+        lo = 0 if start is None else int(np.searchsorted(self.epochs, start, side="left"))
+        hi = len(self.epochs) if end is None else int(np.searchsorted(self.epochs, end, side="left"))
+        return slice(lo, max(lo, hi))
+
+    def _grouped(self, codes, size, window):
+        counts = np.bincount(codes, minlength=size)
+        revenue = np.bincount(codes, weights=self.amounts[window], minlength=size)
+        return counts, revenue
+
+    def by_type(self, start=None, end=None):
+        """Return [(type, count, revenue)] for the window."""
+        window = self.window(start, end)
+        counts, revenue = self._grouped(self.kinds[window], len(KINDS), window)
+        return [(KINDS[i], int(counts[i]), float(revenue[i])) for i in range(len(KINDS))]
+
+    def by_service(self, start=None, end=None):
+        """Return [(service, count, revenue)], highest revenue first."""
+        window = self.window(start, end)
+        counts, revenue = self._grouped(self.services[window], len(self.service_names), window)
+        return _ranked(self.service_names, counts, revenue)
+
+    def by_staff(self, start=None, end=None):
+        """Return [(staff id or None, count, revenue)], highest revenue first."""
+        window = self.window(start, end)
+        ids, codes = np.unique(self.staff[window], return_inverse=True)
+        counts, revenue = self._grouped(codes, len(ids), window)
+        return _ranked([int(i) or None for i in ids], counts, revenue)
+
+    def by_month_of_year(self, start=None, end=None):
+        """Return [(month 1-12, count, revenue)] with every year's same month combined."""
+        window = self.window(start, end)
+        months = self.epochs[window].astype("datetime64[s]").astype("datetime64[M]").astype(np.int64) % 12
+        counts, revenue = self._grouped(months, 12, window)
+        return [(m + 1, int(counts[m]), float(revenue[m])) for m in range(12)]
+
+    def monthly(self, start=None, end=None):
+        """Return (labels, revenue) per calendar month from the first to the last sale in the window."""
+        window = self.window(start, end)
+        months = self.epochs[window].astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+        if not len(months):
+            return [], np.zeros(0)
+        first = months[0]
+        revenue = np.bincount(months - first, weights=self.amounts[window])
+        labels = [str(np.datetime64(int(first + i), "M")) for i in range(len(revenue))]
+        return labels, revenue
+
+
+def moving_average(values, window):
+    """Trailing moving average; the first window-1 points average what is available."""
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return values
+    sums = np.cumsum(values)
+    sums[window:] = sums[window:] - sums[:-window]
+    sizes = np.minimum(np.arange(1, len(values) + 1), window)
+    return sums / sizes
+
+
+def _ranked(names, counts, revenue):
+    order = np.argsort(-revenue, kind="stable")
+    return [(names[i], int(counts[i]), float(revenue[i])) for i in order if counts[i]]
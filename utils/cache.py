@@ -0,0 +1,64 @@
+from collections import OrderedDict
+
+DATASETS = ("invoices", "logs", "coin_invoices")
+
+
+class DatasetVersions:
+    """Per-dataset write counters; a cached result is valid while the versions it was built at are current."""
+
+    def __init__(self):
+        self.counters = dict.fromkeys(DATASETS, 0)
+
+    def bump(self, *datasets):
+        for name in datasets:
+            self.counters[name] += 1
+
+    def snapshot(self, datasets):
+        return tuple(self.counters[name] for name in datasets)
+
+
+class ResultCache:
+    """LRU cache of command results, each stored with the dataset versions it was computed at."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # key -> (versions, value)
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0  # misses caused by a write since the entry was stored
+        self.evictions = 0
+
+    def get(self, key, versions):
+        """Return (True, value) on a hit, (False, None) otherwise."""
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == versions:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+        if entry is not None:
+            del self.entries[key]
+            self.stale += 1
+        self.misses += 1
+        return False, None
+
+    def put(self, key, versions, value):
+        self.entries[key] = (versions, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,73 @@
+import asyncio
+import time
+from collections import Counter
+
+MAX_RATE_LIMIT_RETRIES = 3  # times an item is retried after a rate limit escalated past the HTTP client
+
+
+class BatchReport:
+    """Outcome counts and timing for one dispatch batch."""
+
+    def __init__(self):
+        self.outcomes = Counter()
+        self.errors = []  # (item, exception) for items that failed
+        self.elapsed = 0.0
+        self.rate_limited = 0  # pauses taken because of a rate limit
+
+    @property
+    def total(self):
+        return sum(self.outcomes.values())
+
+    @property
+    def throughput(self):
+        return self.total / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        counts = ", ".join(f"{count} {outcome}" for outcome, count in self.outcomes.most_common())
+        text = f"{counts or 'nothing'} in {self.elapsed:.1f}s ({self.throughput:.1f}/s)"
+        if self.rate_limited:
+            text += f", paused {self.rate_limited}x for rate limits"
+        return text
+
+
+async def dispatch(items, handler, workers=4):
+    """Run handler(item) for every item with at most `workers` calls in flight.
+
+    handler returns an outcome label (e.g. "sent") that is counted in the
+    report; an exception counts as "failed". The HTTP client already waits
+    out per-route rate-limit buckets; when one escalates anyway (anything
+    with a retry_after, such as discord.RateLimited) every worker pauses for
+    that long and the item is retried. Returns (report, {outcome: [items]}).
+    """
+    report = BatchReport()
+    by_outcome = {}
+    queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait((item, 0))
+    resume_at = 0.0
+    started = time.perf_counter()
+
+    async def worker():
+        nonlocal resume_at
+        while not queue.empty():
+            item, attempts = queue.get_nowait()
+            delay = resume_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                outcome = await handler(item)
+            except Exception as exc:
+                retry_after = getattr(exc, "retry_after", None)
+                if retry_after is not None and attempts < MAX_RATE_LIMIT_RETRIES:
+                    resume_at = max(resume_at, time.monotonic() + retry_after)
+                    report.rate_limited += 1
+                    queue.put_nowait((item, attempts + 1))
+                    continue
+                outcome = "failed"
+                report.errors.append((item, exc))
+            report.outcomes[outcome] += 1
+            by_outcome.setdefault(outcome, []).append(item)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(workers, queue.qsize())))))
+    report.elapsed = time.perf_counter() - started
+    return report, by_outcome
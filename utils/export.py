@@ -0,0 +1,86 @@
+import csv
+import io
+import json
+import zlib
+from utils.records import Invoice, LogEntry, CoinInvoice
+from utils.rollups import COINS
+
+DATE_FIELDS = {"invoices": "generated_at", "logs": "generated_at", "coin_invoices": "purchased_at"}
+# One CSV header for every dataset: the union of the record fields, in declaration order
+COLUMNS = ["dataset"] + list(dict.fromkeys(Invoice._fields + LogEntry._fields + CoinInvoice._fields))
+
+
+def export_rows(dataset, records, start=None, end=None, user_id=None, service=None):
+    """Yield a row dict for each record dated in [start, end) that matches the user and service filters.
+
+    Coin invoices have no service and match the service name "coins".
+    """
+    date_field = DATE_FIELDS[dataset]
+    for record in records:
+        ts = getattr(record, date_field)
+        if (start is not None or end is not None) and ts is None:
+            continue
+        if start is not None and ts < start or end is not None and ts >= end:
+            continue
+        if user_id is not None and record.user_id != user_id:
+            continue
+        if service is not None:
+            name = COINS if dataset == "coin_invoices" else record.service
+            if (name or "").lower() != service:
+                continue
+        row = record.to_dict()
+        row["dataset"] = dataset
+        yield row
+
+
+def encode_rows(rows, fmt, header=False):
+    """Yield text chunks for rows as CSV (fixed COLUMNS) or JSON Lines; header writes the CSV header first."""
+    if fmt == "jsonl":
+        for row in rows:
+            yield json.dumps(row, separators=(",", ":")) + "\n"
+        return
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, COLUMNS, lineterminator="\n")
+    if header:
+        writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= 65536:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+class ExportWriter:
+    """Writes encoded chunks to a binary file, optionally as one gzip stream.
+
+    Each batch is encoded and (de)flated as it arrives, so memory stays at
+    one batch whatever the export size.
+    """
+
+    def __init__(self, fileobj, fmt="csv", compress=False):
+        self.fileobj = fileobj
+        self.fmt = fmt
+        self.rows = 0
+        self._header = fmt == "csv"
+        self._deflate = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+
+    def write(self, rows):
+        """Encode and write an iterable of rows; blocking, so run it off the loop."""
+        for chunk in encode_rows(self._counted(rows), self.fmt, self._header):
+            data = chunk.encode("utf-8")
+            self.fileobj.write(self._deflate.compress(data) if self._deflate else data)
+        self._header = False
+
+    def close(self):
+        """Finish the gzip stream (if any) and rewind the file for upload."""
+        if self._deflate:
+            self.fileobj.write(self._deflate.flush())
+        self.fileobj.flush()
+        self.fileobj.seek(0)
+
+    def _counted(self, rows):
+        for row in rows:
+            self.rows += 1
+            yield row
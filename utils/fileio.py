@@ -0,0 +1,104 @@
+import asyncio
+import copy
+import functools
+import json
+import os
+import stat
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Shared pool for blocking disk work. Waits on the disk release the GIL, so they overlap with the
+# event loop; json decoding does not, and parsing a large file here still stalls the loop for about as
+# long as the parse (scripts/loop_lag.py), so whole datasets are only parsed at startup.
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="storage-io")
+NEW_FILE_MODE = 0o644  # permissions of a file write_json_file creates; existing files keep theirs
+
+
+async def run_io(func, *args, **kwargs):
+    """Run a blocking call in the storage thread pool and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def read_json_file(path, default=None):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+
+def write_json_file(path, data, indent=None):
+    """Write data atomically: dump to a temp file in the same folder, then rename over path.
+
+    The temp file is created owner-only, so it is given path's current mode first.
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as f:
+            if indent is None:
+                json.dump(data, f, separators=(",", ":"))
+            else:
+                json.dump(data, f, indent=indent)
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = NEW_FILE_MODE
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+async def read_json(path, default=None):
+    return await run_io(read_json_file, path, default)
+
+
+async def write_json(path, data, indent=None):
+    """Persist data off the loop. Pass a snapshot the caller will not mutate meanwhile.
+
+    Nothing orders two calls for the same path; files saved from more than
+    one place should go through a JsonFile instead.
+    """
+    await run_io(write_json_file, path, data, indent)
+
+
+class JsonFile:
+    """The single writer for one small JSON file.
+
+    save() takes the live object: saves run one at a time under the file's
+    lock, each writing a copy of the object taken when its turn comes, so
+    the newest state is always written last; saves queued behind a write
+    collapse into one. update() does a read-modify-write under the same lock.
+    """
+
+    def __init__(self, path, default=None, indent=None):
+        self.path = path
+        self.default = default
+        self.indent = indent
+        self.lock = asyncio.Lock()
+        self._requested = 0
+        self._written = 0
+
+    async def read(self):
+        return await run_io(read_json_file, self.path, copy.deepcopy(self.default))
+
+    async def save(self, data):
+        self._requested += 1
+        ticket = self._requested
+        async with self.lock:
+            if self._written >= ticket:
+                return  # a save queued after ours already wrote the newer state
+            ticket = self._requested
+            await run_io(write_json_file, self.path, copy.deepcopy(data), self.indent)
+            self._written = ticket
+
+    async def update(self, func):
+        """Read the file, apply func(data) to it in place and write it back; returns func's result."""
+        async with self.lock:
+            data = await self.read()
+            result = func(data)
+            await run_io(write_json_file, self.path, data, self.indent)
+            return result
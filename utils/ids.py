@@ -0,0 +1,31 @@
+import threading
+import time
+
+ID_EPOCH_MS = 1735689600000  # 2025-01-01 UTC; ids count milliseconds from here
+SEQUENCE_BITS = 12  # ids handed out within one millisecond
+
+
+class IdGenerator:
+    """Snowflake-style record ids: milliseconds since ID_EPOCH_MS, shifted, plus a sequence.
+
+    Strictly increasing within the process (a clock step backwards just
+    continues from the last id), time-ordered across restarts, and they fit
+    the 53 bits a JSON number holds exactly.
+    """
+
+    def __init__(self):
+        self._last = 0
+        self._lock = threading.Lock()  # storage threads hand out ids too
+
+    def next_id(self):
+        candidate = (int(time.time() * 1000) - ID_EPOCH_MS) << SEQUENCE_BITS
+        with self._lock:
+            self._last = max(candidate, self._last + 1)
+            return self._last
+
+
+_generator = IdGenerator()
+
+
+def new_id():
+    return _generator.next_id()
@@ -0,0 +1,74 @@
+import json
+import os
+import threading
+
+
+class Journal:
+    """Append-only JSONL file of [seq, record] lines.
+
+    seq is the record's position in the full dataset, so a replay after a
+    crash mid compaction skips lines the compacted files already contain.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    def replay(self, base):
+        """Return the journaled records that follow the first base records."""
+        records = []
+        self.pending = 0
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return records
+
+        offset = 0
+        for line in data.splitlines(keepends=True):
+            try:
+                seq, record = json.loads(line)
+            except ValueError:
+                # Torn final line from an interrupted append; cut it off so
+                # the next append starts on a clean line.
+                with open(self.path, "r+b") as f:
+                    f.truncate(offset)
+                break
+            offset += len(line)
+            if seq == base + len(records):
+                records.append(record)
+                self.pending += 1
+        return records
+
+    def append(self, start, records):
+        """Append records whose positions in the full dataset begin at start."""
+        lines = "".join(
+            json.dumps([start + i, record], separators=(",", ":")) + "\n"
+            for i, record in enumerate(records)
+        )
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(lines)
+            self.pending += len(records)
+
+    def truncate(self, upto):
+        """Drop the lines for the first upto records once they are stored elsewhere."""
+        tmp = self.path + ".tmp"
+        with self._lock:
+            try:
+                with open(self.path, "r") as f:
+                    tail = [line for line in f if _seq(line) >= upto]
+            except FileNotFoundError:
+                tail = []
+            with open(tmp, "w") as f:
+                f.writelines(tail)
+            os.replace(tmp, self.path)
+            self.pending = len(tail)
+
+
+def _seq(line):
+    try:
+        return json.loads(line)[0]
+    except (ValueError, IndexError, TypeError):
+        return -1
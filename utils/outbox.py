@@ -0,0 +1,203 @@
+import asyncio
+from collections import Counter
+from utils.fileio import run_io
+from utils.records import Notification, now_epoch
+from utils.scheduler import DueQueue, DueTimer
+from utils.storage import Dataset
+
+OUTBOX_FILE = "./data/outbox.json"
+MAX_ATTEMPTS = 8  # delivery attempts before a notification is dead-lettered
+BACKOFF_BASE = 5  # seconds before the first retry, doubled after each failed attempt
+BACKOFF_MAX = 3600
+RETENTION = 7 * 86400  # delivered and dead notifications are kept this long for status lookups
+
+PENDING = "pending"
+SENT = "sent"
+DMS_CLOSED = "dms closed"
+DEAD = "dead"
+FINISHED = (SENT, DMS_CLOSED, DEAD)
+RECORD_KINDS = ("invoice", "reminder", "coin invoice")  # DM kinds whose ref is keyed on the record id
+
+
+def record_ref(kind, record_id):
+    return f"{kind}:{record_id}"
+
+
+def notification_ref(kind, record):
+    """Stable key for the DM about a record, so re-enqueueing it (e.g. after a restart) is a no-op."""
+    if getattr(record, "id", None) is not None:
+        return record_ref(kind, record.id)
+    ts = getattr(record, "generated_at", None) or getattr(record, "purchased_at", None)
+    return f"{kind}:{record.user_id}:{ts}:{getattr(record, 'service', None) or ''}"
+
+
+def backoff(attempts):
+    """Seconds to wait before the next attempt after `attempts` failures."""
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+class Outbox:
+    """Persisted queue of DMs for the outbox workers to deliver.
+
+    A notification is written to disk before enqueue() returns, so neither a
+    failed send nor a restart loses it. Pending ones are kept in a DueQueue
+    on their next attempt time, and the timer is poked whenever one becomes
+    due sooner. Each carries a ref (see notification_ref), so the
+    delivery status of a given invoice can be looked up and enqueueing the
+    same ref twice is a no-op; enqueueing a dead ref again revives it.
+    """
+
+    def __init__(self, path=OUTBOX_FILE):
+        self._data = Dataset(path, Notification)
+        self._queue = DueQueue()
+        self._by_ref = {}
+        self._attempted = {}  # notification id -> event set after its next attempt
+        self._last_id = 0
+        self.timer = DueTimer()
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+
+    def load_sync(self):
+        self._data.load()
+        self._prune(now_epoch())
+        self._index_refs()
+        self._last_id = max((n.id for n in self._data.records), default=0)
+        self._queue = DueQueue((n.next_attempt_at, n) for n in self._data.records if n.status == PENDING)
+        self._loaded = True
+
+    async def load(self):
+        async with self._load_lock:
+            if not self._loaded:
+                await run_io(self.load_sync)
+
+    def _index_refs(self):
+        # A ref owned by a dead notification and a later one (older files) maps to the live one
+        self._by_ref = {}
+        for n in self._data.records:
+            owner = self._by_ref.get(n.ref)
+            if owner is None or owner.status == DEAD:
+                self._by_ref[n.ref] = n
+
+    def _prune(self, now):
+        self._data.records = [
+            n for n in self._data.records
+            if n.status not in FINISHED or (n.finished_at or 0) > now - RETENTION
+        ]
+
+    async def enqueue(self, user_id, kind, ref, embed):
+        """Queue a DM of embed (a dict) to user_id and persist it; returns the notification.
+
+        A dead notification for ref is reset and queued again rather than duplicated.
+        """
+        existing = self._by_ref.get(ref)
+        if existing is not None and existing.status != DEAD:
+            return existing
+        now = now_epoch()
+        if existing is not None:
+            existing.user_id, existing.embed = user_id, embed
+            self._revive(existing, now)
+            await self._data.save()
+            self.timer.poke()
+            return existing
+        self._last_id += 1
+        notification = Notification(
+            id=self._last_id,
+            user_id=user_id, kind=kind, ref=ref, embed=embed, status=PENDING,
+            attempts=0, created_at=now, next_attempt_at=now
+        )
+        self._by_ref[ref] = notification
+        self._queue.push(now, notification)
+        await self._data.extend([notification])
+        self.timer.poke()
+        return notification
+
+    def get(self, ref):
+        """The notification for ref, or None if there is none (finished ones are kept for RETENTION)."""
+        return self._by_ref.get(ref)
+
+    def status(self, ref):
+        """Delivery status of the notification for ref, or None if there is none."""
+        notification = self._by_ref.get(ref)
+        return notification.status if notification else None
+
+    def next_due(self):
+        return self._queue.next_due()
+
+    def due(self, now):
+        return self._queue.due(now)
+
+    async def record_attempt(self, notification, outcome=None, error=None):
+        """Record one delivery attempt: outcome SENT, DMS_CLOSED or DEAD ends it; None retries after a backoff."""
+        now = now_epoch()
+        notification.attempts += 1
+        notification.last_error = str(error)[:200] if error is not None else None
+        if outcome is None and notification.attempts >= MAX_ATTEMPTS:
+            outcome = DEAD
+        if outcome is None:
+            notification.next_attempt_at = now + backoff(notification.attempts)
+            self._queue.push(notification.next_attempt_at, notification)
+        else:
+            notification.status = outcome
+            notification.finished_at = now
+            self._queue.discard(notification)
+        event = self._attempted.pop(notification.id, None)
+        if event is not None:
+            event.set()
+        await self._data.save()
+        return notification.status if outcome is not None else PENDING
+
+    async def wait_attempt(self, notification, timeout):
+        """Wait up to timeout seconds for the next attempt at notification; returns its status."""
+        if notification.status == PENDING:
+            event = self._attempted.setdefault(notification.id, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return notification.status
+
+    async def retry_dead(self):
+        """Put every dead-lettered notification back in the queue; returns how many."""
+        now = now_epoch()
+        # Skip dead ones whose ref already has a live notification, so no DM goes out twice
+        dead = [n for n in self._data.records if n.status == DEAD and self._by_ref.get(n.ref) is n]
+        for notification in dead:
+            self._revive(notification, now)
+        if dead:
+            await self._data.save()
+            self.timer.poke()
+        return len(dead)
+
+    def _revive(self, notification, now):
+        notification.status = PENDING
+        notification.attempts = 0
+        notification.finished_at = None
+        notification.next_attempt_at = now
+        self._queue.push(now, notification)
+
+    async def prune(self):
+        """Forget finished notifications older than RETENTION."""
+        before = len(self._data.records)
+        self._prune(now_epoch())
+        if len(self._data.records) != before:
+            self._index_refs()
+            await self._data.save()
+
+    def counts(self):
+        return Counter(n.status for n in self._data.records)
+
+    def dead_letters(self, limit=10):
+        """Most recently dead-lettered notifications first."""
+        dead = [n for n in self._data.records if n.status == DEAD]
+        return sorted(dead, key=lambda n: n.finished_at or 0, reverse=True)[:limit]
+
+
+_outbox = None
+
+
+def get_outbox():
+    """Return the shared outbox used by every cog that sends DMs."""
+    global _outbox
+    if _outbox is None:
+        _outbox = Outbox()
+    return _outbox
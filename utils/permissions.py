@@ -1,8 +1,14 @@
 import json
 import os
+import time
+from collections import OrderedDict
 from discord import Member, Role
+from utils.fileio import JsonFile
 
 PERMS_FILE = "./data/permissions.json"
+RECHECK_INTERVAL = 5  # seconds between mtime checks for edits made to the file outside the bot
+DECISION_CACHE_SIZE = 4096  # (guild, member) pairs whose per-cog decisions are remembered, least recently used dropped
+NO_ONE = (frozenset(), frozenset())
 
 def load_permissions():
     if not os.path.exists(PERMS_FILE) or os.stat(PERMS_FILE).st_size == 0:
@@ -10,45 +16,124 @@ def load_permissions():
     with open(PERMS_FILE, "r") as f:
         return json.load(f)
 
-def save_permissions(perms):
-    with open(PERMS_FILE, "w") as f:
-        json.dump(perms, f, indent=4)
+perms_file = JsonFile(PERMS_FILE, {}, indent=4)  # add_perms/remove_perms read-modify-write under its lock
+
+def _mtime():
+    try:
+        return os.stat(PERMS_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class PermissionTable:
+    """In-memory copy of PERMS_FILE: cog -> (allowed role ids, allowed user ids) as frozensets.
+
+    add_perms()/remove_perms() rebuild it from what they wrote; otherwise the file's
+    mtime is checked at most every RECHECK_INTERVAL seconds, so a permission
+    check normally touches no disk at all.
+
+    Decisions are also memoized per (guild, member, cog). A reload drops
+    them all, and forget_member() drops one member's when their roles change.
+    """
+
+    def __init__(self):
+        self._cogs = {}
+        self._mtime = None
+        self._checked = None  # monotonic time of the last mtime check, None before the first load
+        self._decisions = OrderedDict()  # (guild id, member id) -> {cog: allowed}
+
+    def load(self, perms=None):
+        """Rebuild from perms (as stored in PERMS_FILE), or read the file."""
+        mtime = _mtime()  # taken first, so a write racing the read is picked up next check
+        if perms is None:
+            perms = load_permissions()
+        self._cogs = {
+            cog: (frozenset(entry.get("roles", [])), frozenset(entry.get("users", [])))
+            for cog, entry in perms.items()
+        }
+        self._mtime = mtime
+        self._checked = time.monotonic()
+        self._decisions = OrderedDict()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked is None or now - self._checked >= RECHECK_INTERVAL:
+            if self._checked is None or _mtime() != self._mtime:
+                self.load()
+            self._checked = now
+
+    def get(self, cog):
+        """(role ids, user ids) allowed to use cog."""
+        self._refresh()
+        return self._cogs.get(cog.lower(), NO_ONE)
+
+    def allowed(self, cog, member):
+        """Whether member may use cog, memoized until the table reloads or the member's roles change."""
+        self._refresh()
+        cog = cog.lower()
+        guild = getattr(member, "guild", None)
+        key = (guild.id if guild else None, member.id)
+        decisions = self._decisions
+        cogs = decisions.get(key)
+        if cogs is None:
+            cogs = decisions[key] = {}
+            if len(decisions) > DECISION_CACHE_SIZE:
+                decisions.popitem(last=False)
+        else:
+            decisions.move_to_end(key)
+        decision = cogs.get(cog)
+        if decision is None:
+            allowed_roles, allowed_users = self._cogs.get(cog, NO_ONE)
+            decision = cogs[cog] = member.id in allowed_users or not allowed_roles.isdisjoint(role.id for role in member.roles)
+        return decision
+
+    def forget_member(self, guild_id, member_id):
+        self._decisions.pop((guild_id, member_id), None)
+
+    def forget_all(self):
+        self._decisions = OrderedDict()
+
+
+_table = None
+
+def get_permission_table():
+    global _table
+    if _table is None:
+        _table = PermissionTable()
+    return _table
 
 def user_has_permission(cog_name, member: Member):
-    perms = load_permissions().get(cog_name.lower(), {})
-    allowed_roles = perms.get("roles", [])
-    allowed_users = perms.get("users", [])
-    return member.id in allowed_users or any(role.id in allowed_roles for role in member.roles)
+    return get_permission_table().allowed(cog_name, member)
 
-def add_perms(cog: str, roles: list[Role], users: list[Member]):
+async def add_perms(cog: str, roles: list[Role], users: list[Member]):
     cog = cog.lower()
-    perms = load_permissions()
-    if cog not in perms:
-        perms[cog] = {"roles": [], "users": []}
 
-    for role in roles:
-        if role.id not in perms[cog]["roles"]:
-            perms[cog]["roles"].append(role.id)
-    for user in users:
-        if user.id not in perms[cog]["users"]:
-            perms[cog]["users"].append(user.id)
+    def add(perms):
+        if cog not in perms:
+            perms[cog] = {"roles": [], "users": []}
+        for role in roles:
+            if role.id not in perms[cog]["roles"]:
+                perms[cog]["roles"].append(role.id)
+        for user in users:
+            if user.id not in perms[cog]["users"]:
+                perms[cog]["users"].append(user.id)
+        return perms
 
-    save_permissions(perms)
+    get_permission_table().load(await perms_file.update(add))
 
-def remove_perms(cog: str, roles: list[Role], users: list[Member]):
+async def remove_perms(cog: str, roles: list[Role], users: list[Member]):
     cog = cog.lower()
-    perms = load_permissions()
-    if cog not in perms:
-        return
-
-    for role in roles:
-        if role.id in perms[cog]["roles"]:
-            perms[cog]["roles"].remove(role.id)
-    for user in users:
-        if user.id in perms[cog]["users"]:
-            perms[cog]["users"].remove(user.id)
-
-    save_permissions(perms)
+
+    def remove(perms):
+        for role in roles:
+            if role.id in perms.get(cog, {}).get("roles", []):
+                perms[cog]["roles"].remove(role.id)
+        for user in users:
+            if user.id in perms.get(cog, {}).get("users", []):
+                perms[cog]["users"].remove(user.id)
+        return perms
+
+    get_permission_table().load(await perms_file.update(remove))
 
 def get_perms(cog: str):
     cog = cog.lower()
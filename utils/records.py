@@ -0,0 +1,142 @@
+import calendar
+import time
+from datetime import datetime
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Version 1: bare JSON lists of dicts with "%Y-%m-%d %H:%M:%S" date strings.
+# Version 2: {"schema": 2, "records": [...]} with the slot names below and epoch seconds.
+SCHEMA_VERSION = 2
+
+LEGACY_DURATION = 28 * 86400  # services ran 28 days before invoices stored their expiry
+
+
+def to_epoch(value):
+    """Convert a stored UTC date string (or an epoch already) to epoch seconds; None if unusable."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return calendar.timegm(time.strptime(value, DATE_FORMAT))
+    except (TypeError, ValueError):
+        return None
+
+
+def format_epoch(ts, fmt=DATE_FORMAT):
+    return datetime.utcfromtimestamp(ts).strftime(fmt) if ts is not None else "N/A"
+
+
+def now_epoch():
+    return int(time.time())
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Record:
+    """Base for the typed records. Subclasses declare their slots, _fields and the schema 1 keys."""
+
+    __slots__ = ()
+    _fields = ()  # every slot, including inherited ones
+    _legacy = {}  # slot -> key used by the schema 1 dicts
+    _epochs = ()  # slots holding epoch seconds
+    _ints = ()  # slots holding Discord or record ids
+
+    def __init__(self, **fields):
+        for slot in self._fields:
+            setattr(self, slot, fields.get(slot))
+
+    @classmethod
+    def from_dict(cls, data):
+        """Decode and validate a record once, from either schema version."""
+        if any(key not in cls._fields for key in data):
+            data = {slot: data.get(key) for slot, key in cls._legacy.items()}
+        record = cls(**data)
+        for slot in cls._epochs:
+            setattr(record, slot, to_epoch(getattr(record, slot)))
+        for slot in cls._ints:
+            setattr(record, slot, _to_int(getattr(record, slot)))
+        return record
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self._fields if getattr(self, slot) is not None}
+
+    def __repr__(self):
+        fields = ", ".join(f"{slot}={getattr(self, slot)!r}" for slot in self._fields)
+        return f"{type(self).__name__}({fields})"
+
+
+class Invoice(Record):
+    __slots__ = ("id", "user_id", "service", "amount", "ingame_name", "staff", "proof",
+                 "generated_at", "expires_at", "remind_at", "idempotency_key")
+    _fields = __slots__
+    _legacy = {
+        "user_id": "UserID", "service": "service", "amount": "amount",
+        "ingame_name": "ingame_name", "staff": "staff", "proof": "proof",
+        "generated_at": "invoice_generated", "expires_at": "expiration", "remind_at": "reminder",
+    }
+    _epochs = ("generated_at", "expires_at", "remind_at")
+    _ints = ("id", "user_id", "staff")
+
+    @property
+    def expiry(self):
+        """expires_at, falling back to the old fixed duration for invoices that never stored it."""
+        if self.expires_at is not None:
+            return self.expires_at
+        if self.generated_at is not None:
+            return self.generated_at + LEGACY_DURATION
+        return None
+
+
+class LogEntry(Invoice):
+    """An archived invoice, or a manual reminder (those carry a status and no generated_at)."""
+
+    __slots__ = ("status", "reminded_at", "purchased_at")
+    _fields = Invoice._fields + __slots__
+    _legacy = dict(Invoice._legacy, status="status", reminded_at="reminder_generated", purchased_at="purchase_date")
+    _epochs = Invoice._epochs + ("reminded_at", "purchased_at")
+
+    @classmethod
+    def from_invoice(cls, invoice, **fields):
+        """Log entry for an archived invoice; it keeps the invoice's id, but not its idempotency key."""
+        copied = {slot: getattr(invoice, slot) for slot in Invoice._fields if slot != "idempotency_key"}
+        return cls(**copied, **fields)
+
+
+class CoinInvoice(Record):
+    __slots__ = ("id", "user_id", "username", "ingame_name", "coins", "inr_amount", "discount",
+                 "final_amount", "purchased_at", "staff")
+    _fields = __slots__
+    _legacy = {
+        "user_id": "UserID", "username": "Username", "ingame_name": "InGameName", "coins": "Coins",
+        "inr_amount": "INR_Equivalent", "discount": "Discount", "final_amount": "Final_INR_Amount",
+        "purchased_at": "DateOfPurchase", "staff": "StaffHandler",
+    }
+    _epochs = ("purchased_at",)
+    _ints = ("id", "user_id", "staff")
+
+
+class Notification(Record):
+    """A DM waiting in (or delivered from) the outbox; embed is discord.Embed.to_dict() output."""
+
+    __slots__ = ("id", "user_id", "kind", "ref", "embed", "status", "attempts",
+                 "created_at", "next_attempt_at", "finished_at", "last_error")
+    _fields = __slots__
+    _epochs = ("created_at", "next_attempt_at", "finished_at")
+    _ints = ("id", "user_id", "attempts")
+
+
+def decode_records(data, cls):
+    """Decode a dataset file of either schema version into typed records."""
+    if isinstance(data, dict):
+        data = data.get("records", [])
+    return [cls.from_dict(item) for item in data or []]
+
+
+def encode_records(records):
+    return {"schema": SCHEMA_VERSION, "records": [record.to_dict() for record in records]}
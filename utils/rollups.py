@@ -0,0 +1,154 @@
+import time
+
+ACTIVE = "Service Active"
+LOGGED = "Service Logged"
+COINS = "Coins"
+
+
+def sale_of(kind, record):
+    """Return (epoch, service, amount) for a record counted as a sale of the given kind."""
+    if kind == COINS:
+        return record.purchased_at, COINS, record.final_amount
+    return record.generated_at, record.service, record.amount
+
+
+class Rollup:
+    """Counters keyed by fixed-size tuples, stored as flat [key..., value...] rows.
+
+    Keys touched since the last take_changes() are remembered, so only the
+    changed rows need to be written. A row whose counts all fall back to
+    zero is dropped.
+    """
+
+    key_size = 0
+    width = 0  # values per row
+    counts = (0,)  # value positions that count records; a row is empty when they are all zero
+
+    def __init__(self, counters=None):
+        self.counters = counters or {}
+        self.changed = set()
+
+    @classmethod
+    def from_dict(cls, data):
+        rollup = cls()
+        rollup.apply(data.get("counters", []))
+        rollup.changed = set()
+        return rollup
+
+    def to_dict(self):
+        return {"counters": [list(key) + list(value) for key, value in self.counters.items()]}
+
+    def apply(self, rows):
+        """Overwrite counters with [key..., value...] rows; empty rows delete theirs."""
+        for row in rows:
+            key, values = tuple(row[:self.key_size]), row[self.key_size:]
+            if self._empty(values):
+                self.counters.pop(key, None)
+            else:
+                self.counters[key] = values
+            self.changed.add(key)
+
+    def take_changes(self):
+        """Rows for the keys changed since the last call, current values (zeros once dropped)."""
+        rows = []
+        for key in self.changed:
+            rows.append(list(key) + list(self.counters.get(key, [0] * self.width)))
+        self.changed = set()
+        return rows
+
+    def _counter(self, key):
+        self.changed.add(key)
+        return self.counters.setdefault(key, [0] * self.width)
+
+    def _settle(self, key):
+        if self._empty(self.counters[key]):
+            del self.counters[key]
+
+    def _empty(self, values):
+        return all(values[i] == 0 for i in self.counts)
+
+
+class SalesRollup(Rollup):
+    """Per-(year, month, type, service) sale counters: [invoice count, revenue].
+
+    Kept in step with every write so /sale never has to read the records.
+    Dates are bucketed in UTC, matching the SQLite backend's rollup table.
+    """
+
+    key_size = 4
+    width = 2
+
+    def add(self, kind, records, sign=1):
+        """Count records as sales of kind; sign=-1 takes them back out."""
+        for record in records:
+            ts, service, amount = sale_of(kind, record)
+            if ts is None:
+                continue
+            date = time.gmtime(ts)
+            key = (date.tm_year, date.tm_mon, kind, service or "")
+            counter = self._counter(key)
+            counter[0] += sign
+            counter[1] += sign * (amount or 0)
+            if sign < 0:
+                self._settle(key)
+
+    def summary(self, year=None, month=None):
+        """Return {type: [count, revenue]} over the matching months (month matches every year)."""
+        totals = {}
+        for (y, m, kind, _service), (count, revenue) in self.counters.items():
+            if (year is None or y == year) and (month is None or m == month):
+                total = totals.setdefault(kind, [0, 0])
+                total[0] += count
+                total[1] += revenue
+        return totals
+
+
+class StaffRollup(Rollup):
+    """Per-(UTC day, staff id) counters for /staffstats.
+
+    Values: [service invoices, service revenue, coin sales, coin revenue,
+    reminders sent]. Sales follow the same records as SalesRollup (staff 0
+    when unknown); reminders are log entries with a reminded_at date.
+    """
+
+    key_size = 2
+    width = 5
+    counts = (0, 2, 4)
+
+    def _bump(self, ts, staff, offset, amount, sign):
+        key = (ts // 86400, staff or 0)
+        counter = self._counter(key)
+        counter[offset] += sign
+        if amount is not None:
+            counter[offset + 1] += sign * amount
+        if sign < 0:
+            self._settle(key)
+
+    def add_sales(self, kind, records, sign=1):
+        for record in records:
+            ts, _service, amount = sale_of(kind, record)
+            if ts is not None:
+                self._bump(ts, record.staff, 2 if kind == COINS else 0, amount or 0, sign)
+
+    def add_reminders(self, entries, sign=1):
+        for entry in entries:
+            if entry.reminded_at is not None:
+                self._bump(entry.reminded_at, entry.staff, 4, None, sign)
+
+    def summary(self, start=None, end=None, month=None):
+        """Return {staff id: [invoices, revenue, coin sales, coin revenue, reminders]}.
+
+        Days overlapping [start, end) count whole; month (1-12) matches every year.
+        """
+        first = start // 86400 if start is not None else None
+        last = -(-end // 86400) if end is not None else None
+        totals = {}
+        for (day, staff), values in self.counters.items():
+            if first is not None and day < first or last is not None and day >= last:
+                continue
+            if month is not None and time.gmtime(day * 86400).tm_mon != month:
+                continue
+            total = totals.setdefault(staff, [0, 0, 0, 0, 0])
+            for i, value in enumerate(values):
+                total[i] += value
+        return totals
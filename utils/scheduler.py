@@ -0,0 +1,92 @@
+import asyncio
+import heapq
+import time
+
+
+class DueQueue:
+    """Min-heap of (due epoch, seq, item), with lazy deletion.
+
+    Removing or re-pushing an item only updates which seq is live for it;
+    stale heap entries are dropped when they reach the top. Entries keep
+    their item alive, so an id() is never reused while it is still queued.
+    """
+
+    def __init__(self, entries=(), key=id):
+        """entries: (due epoch, item) pairs; items due None are skipped.
+
+        key maps an item to its identity in the queue: id() by default, so
+        equal records stay distinct; None uses hashable items (e.g. tuples) as they are.
+        """
+        self._key = key or (lambda item: item)
+        self._seq = 0
+        self._heap = []
+        self._live = {}  # key(item) -> seq of its current entry
+        for due, item in entries:
+            if due is not None:
+                self._seq += 1
+                self._heap.append((due, self._seq, item))
+                self._live[self._key(item)] = self._seq
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._live)
+
+    def push(self, due, item):
+        """Queue item at due, replacing any earlier entry for it."""
+        if due is None:
+            self.discard(item)
+            return
+        self._seq += 1
+        heapq.heappush(self._heap, (due, self._seq, item))
+        self._live[self._key(item)] = self._seq
+
+    def discard(self, item):
+        self._live.pop(self._key(item), None)
+
+    def _is_live(self, entry):
+        return self._live.get(self._key(entry[2])) == entry[1]
+
+    def _prune(self):
+        while self._heap and not self._is_live(self._heap[0]):
+            heapq.heappop(self._heap)
+
+    def next_due(self):
+        """Earliest due epoch still queued, or None."""
+        self._prune()
+        return self._heap[0][0] if self._heap else None
+
+    def due(self, now):
+        """Items due at or before now, soonest first; they stay queued until discarded."""
+        taken = []
+        self._prune()
+        while self._heap and self._heap[0][0] <= now:
+            taken.append(heapq.heappop(self._heap))
+            self._prune()
+        for entry in taken:
+            heapq.heappush(self._heap, entry)
+        return [item for _due, _seq, item in taken]
+
+
+class DueTimer:
+    """Sleeps until a due epoch, or until poke() says an earlier one may exist."""
+
+    def __init__(self):
+        self._wake = asyncio.Event()
+
+    def poke(self):
+        self._wake.set()
+
+    async def sleep_until(self, due):
+        """Return True once due is reached, False if poked first (due None sleeps until a poke).
+
+        A poke that lands while the caller was working out due is kept, so
+        the next call returns False straight away and the caller re-checks.
+        """
+        if not self._wake.is_set():
+            timeout = None if due is None else max(due - time.time(), 0)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                return True
+        self._wake.clear()
+        return False
@@ -0,0 +1,234 @@
+import bisect
+import gzip
+import json
+import os
+import time
+from utils.fileio import read_json_file, write_json_file
+from utils.records import SCHEMA_VERSION
+from utils.ids import new_id
+
+MANIFEST_FILE = "manifest.json"
+INDEX_FILE = "index.jsonl"  # [seq, user_id, date, segment key, position, id] per folded record
+STALE_INDEX_FILES = ("users.json", "rows.jsonl")  # earlier index layouts, removed when the index is rebuilt
+UNDATED = "undated"  # segment for records without any date
+COMPRESS_AFTER_MONTHS = 2  # segments this many months old are stored gzipped
+
+
+def segment_key(ts):
+    """Monthly segment ("YYYY-MM", UTC) a record dated ts belongs to."""
+    if ts is None:
+        return UNDATED
+    return time.strftime("%Y-%m", time.gmtime(ts))
+
+
+def _months_old(key):
+    now = time.gmtime()
+    year, month = (int(part) for part in key.split("-"))
+    return (now.tm_year - year) * 12 + now.tm_mon - month
+
+
+class SegmentStore:
+    """Monthly segment files for one append-only dataset, plus a manifest.
+
+    A record is filed by its date_field, or by the first of fallback_fields
+    it has (e.g. a manual reminder log has no generated_at), so only records
+    with no date at all share the undated segment. manifest.json records,
+    per segment, its file, record count, min/max date_field and amount
+    total, and the number of records folded in overall.
+    Segment files only ever grow, and the manifest is written after them,
+    so records past a segment's manifest count belong to an interrupted
+    fold and are ignored when reading.
+
+    index.jsonl holds a short line per folded record with its user, date,
+    segment and position in that segment, and is only ever appended to.
+    Segments only grow, so positions stay valid. The index is loaded into
+    memory as user_id -> (date, seq, key, position) references sorted by
+    date, so one user's records are read from only the segments holding
+    them, and as record id -> (key, position) for lookups by id. It is
+    rebuilt from the segments if it does not cover exactly the manifest
+    count (e.g. after a fold interrupted between the manifest and the
+    index); records stored before ids get one then.
+    """
+
+    def __init__(self, directory, date_field, amount_field, fallback_fields=()):
+        self.directory = directory
+        self.date_field = date_field
+        self.fallback_fields = fallback_fields
+        self.amount_field = amount_field
+        self.manifest = {"schema": SCHEMA_VERSION, "count": 0, "segments": {}}
+        self.users = {}
+        self.ids = {}  # record id -> (segment key, position)
+        self._indexed = 0  # rows covered by the loaded index
+
+    @property
+    def count(self):
+        return self.manifest["count"]
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.directory, MANIFEST_FILE))
+
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = read_json_file(os.path.join(self.directory, MANIFEST_FILE))
+        if manifest:
+            self.manifest = manifest
+        self._load_index()
+        if self._indexed != self.count:
+            self._rebuild_index()
+
+    def segment_of(self, record):
+        """Segment key of a record dict."""
+        for field in (self.date_field, *self.fallback_fields):
+            if record.get(field) is not None:
+                return segment_key(record[field])
+        return UNDATED
+
+    def keys_between(self, start=None, end=None):
+        """Segments that may hold records dated in [start, end); None bounds are open."""
+        keys = []
+        for key, segment in sorted(self.manifest["segments"].items()):
+            if segment["min"] is None:
+                if start is None and end is None:
+                    keys.append(key)
+            elif (start is None or segment["max"] >= start) and (end is None or segment["min"] < end):
+                keys.append(key)
+        return keys
+
+    def read(self, key):
+        """Return the record dicts stored in one segment."""
+        segment = self.manifest["segments"].get(key)
+        if segment is None:
+            return []
+        path = os.path.join(self.directory, segment["file"])
+        try:
+            if path.endswith(".gz"):
+                with gzip.open(path, "rt") as f:
+                    data = json.load(f)
+            else:
+                data = read_json_file(path, {})
+        except (FileNotFoundError, ValueError):
+            data = {}
+        return data.get("records", [])[:segment["count"]]
+
+    def fold(self, records):
+        """Append record dicts to their monthly segments, then publish the new manifest; returns each record's key."""
+        keys = [self.segment_of(record) for record in records]
+        groups = {}
+        for key, record in zip(keys, records):
+            groups.setdefault(key, []).append(record)
+
+        segments = dict(self.manifest["segments"])
+        starts = {key: segments[key]["count"] if key in segments else 0 for key in groups}
+        stale = []
+        for key in sorted(set(segments) | set(groups)):
+            compress = key != UNDATED and _months_old(key) >= COMPRESS_AFTER_MONTHS
+            old = segments.get(key)
+            if key not in groups and (old is None or old["file"].endswith(".gz") == compress):
+                continue
+            stored = self.read(key) + groups.get(key, [])
+            dates = [r[self.date_field] for r in stored if r.get(self.date_field) is not None]
+            segment = {
+                "file": key + (".json.gz" if compress else ".json"),
+                "count": len(stored),
+                "min": min(dates) if dates else None,
+                "max": max(dates) if dates else None,
+                "total": sum(r.get(self.amount_field) or 0 for r in stored),
+            }
+            self._write_segment(segment["file"], stored, compress)
+            if old is not None and old["file"] != segment["file"]:
+                stale.append(old["file"])
+            segments[key] = segment
+
+        manifest = {"schema": SCHEMA_VERSION, "count": self.count + len(records), "segments": segments}
+        write_json_file(os.path.join(self.directory, MANIFEST_FILE), manifest)
+        self.manifest = manifest
+        positions = []
+        for key in keys:
+            positions.append(starts[key])
+            starts[key] += 1
+        self._append_index(records, keys, positions)
+        for name in stale:
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+        return keys
+
+    def user_refs(self, user_id):
+        """(date, seq, segment key, position) references to one user's records, oldest first."""
+        return self.users.get(user_id, [])
+
+    def id_ref(self, record_id):
+        """(segment key, position) of the record with this id, or None."""
+        return self.ids.get(record_id)
+
+    def _add_ref(self, seq, user_id, date, key, position, record_id):
+        if user_id is not None:
+            bisect.insort(self.users.setdefault(user_id, []), (date if date is not None else 0, seq, key, position))
+        if record_id is not None:
+            self.ids[record_id] = (key, position)
+
+    def _load_index(self):
+        """Read index.jsonl up to the manifest count; a torn, out-of-sequence or out-of-range line ends it and is cut off."""
+        self.users, self.ids, self._indexed = {}, {}, 0
+        path = os.path.join(self.directory, INDEX_FILE)
+        valid = 0
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        segments = self.manifest["segments"]
+        for line in data.splitlines(keepends=True):
+            try:
+                seq, user_id, date, key, position, record_id = json.loads(line)
+            except ValueError:
+                break
+            if seq != self._indexed or seq >= self.count or key not in segments or position >= segments[key]["count"]:
+                break
+            self._add_ref(seq, user_id, date, key, position, record_id)
+            self._indexed += 1
+            valid += len(line)
+        if valid < len(data):
+            with open(path, "r+b") as f:
+                f.truncate(valid)
+
+    def _rebuild_index(self):
+        """Rewrite index.jsonl from the segments, giving id-less records an id."""
+        self.users, self.ids, self._indexed = {}, {}, 0
+        for name in (INDEX_FILE, *STALE_INDEX_FILES):
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+        for key, segment in sorted(self.manifest["segments"].items()):
+            records = self.read(key)
+            missing = [record for record in records if record.get("id") is None]
+            for record in missing:
+                record["id"] = new_id()
+            if missing:
+                self._write_segment(segment["file"], records, segment["file"].endswith(".gz"))
+            self._append_index(records, [key] * len(records), range(len(records)))
+
+    def _append_index(self, records, keys, positions):
+        """Append index lines for folded records at the given segment positions, and index them in memory."""
+        entries = []
+        for record, key, position in zip(records, keys, positions):
+            entry = [self._indexed, record.get("user_id"), record.get(self.date_field), key, position, record.get("id")]
+            entries.append(json.dumps(entry, separators=(",", ":")) + "\n")
+            self._add_ref(*entry)
+            self._indexed += 1
+        if entries:
+            with open(os.path.join(self.directory, INDEX_FILE), "a") as f:
+                f.writelines(entries)
+
+    def _write_segment(self, name, records, compress):
+        path = os.path.join(self.directory, name)
+        data = {"schema": SCHEMA_VERSION, "records": records}
+        if not compress:
+            write_json_file(path, data)
+            return
+        tmp = path + ".tmp"
+        with gzip.open(tmp, "wt") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, path)
@@ -0,0 +1,568 @@
+import asyncio
+import functools
+import json
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from utils.records import Invoice, LogEntry, CoinInvoice, now_epoch
+from utils.rollups import ACTIVE, LOGGED, COINS
+from utils.cache import DatasetVersions
+from utils.scheduler import DueTimer
+from utils.ids import new_id
+
+DB_FILE = "./data/invoices.db"
+STREAM_BATCH = 500  # rows per keyset page in stream_records
+SCHEMA_VERSION = 6  # stored in PRAGMA user_version; older databases are rebuilt by _upgrade
+
+# Dates are epoch seconds. Amount columns are left untyped so ints and
+# floats round-trip exactly as the records had them. The id primary key is
+# the record's own id (see utils/ids.py), so lookups by id use the rowid.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    service TEXT COLLATE NOCASE,
+    staff INTEGER,
+    ingame_name TEXT COLLATE NOCASE,
+    amount,
+    generated_at INTEGER,
+    remind_at INTEGER,
+    expires_at INTEGER,
+    idempotency_key TEXT UNIQUE,
+    data TEXT NOT NULL
+);
+DROP INDEX IF EXISTS idx_invoices_user;
+CREATE INDEX IF NOT EXISTS idx_invoices_user_date ON invoices(user_id, generated_at);
+CREATE INDEX IF NOT EXISTS idx_invoices_service ON invoices(service);
+CREATE INDEX IF NOT EXISTS idx_invoices_staff ON invoices(staff);
+CREATE INDEX IF NOT EXISTS idx_invoices_generated ON invoices(generated_at);
+CREATE INDEX IF NOT EXISTS idx_invoices_reminder ON invoices(remind_at);
+CREATE INDEX IF NOT EXISTS idx_invoices_expiry ON invoices(expires_at);
+CREATE INDEX IF NOT EXISTS idx_invoices_service_expiry ON invoices(service, expires_at);
+
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    service TEXT COLLATE NOCASE,
+    staff INTEGER,
+    amount,
+    generated_at INTEGER,
+    reminded_at INTEGER,
+    data TEXT NOT NULL
+);
+DROP INDEX IF EXISTS idx_logs_user;
+CREATE INDEX IF NOT EXISTS idx_logs_user_date ON logs(user_id, generated_at);
+CREATE INDEX IF NOT EXISTS idx_logs_service ON logs(service);
+CREATE INDEX IF NOT EXISTS idx_logs_staff ON logs(staff);
+CREATE INDEX IF NOT EXISTS idx_logs_generated ON logs(generated_at);
+
+CREATE TABLE IF NOT EXISTS coin_invoices (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    staff INTEGER,
+    amount,
+    purchased_at INTEGER,
+    data TEXT NOT NULL
+);
+DROP INDEX IF EXISTS idx_coin_invoices_user;
+CREATE INDEX IF NOT EXISTS idx_coin_invoices_user_date ON coin_invoices(user_id, purchased_at);
+CREATE INDEX IF NOT EXISTS idx_coin_invoices_staff ON coin_invoices(staff);
+CREATE INDEX IF NOT EXISTS idx_coin_invoices_date ON coin_invoices(purchased_at);
+
+CREATE TABLE IF NOT EXISTS sales_rollup (
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    service TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    revenue NOT NULL,
+    PRIMARY KEY (year, month, kind, service)
+);
+
+CREATE TABLE IF NOT EXISTS staff_rollup (
+    day INTEGER NOT NULL,
+    staff INTEGER NOT NULL,
+    invoices INTEGER NOT NULL DEFAULT 0,
+    revenue NOT NULL DEFAULT 0,
+    coin_sales INTEGER NOT NULL DEFAULT 0,
+    coin_revenue NOT NULL DEFAULT 0,
+    reminders INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, staff)
+);
+"""
+
+# (table, sale type, date column, service expression) counted in sales_rollup.
+ROLLUP_SOURCES = (
+    ("invoices", ACTIVE, "generated_at", "COALESCE({row}.service, '')"),
+    ("logs", LOGGED, "generated_at", "COALESCE({row}.service, '')"),
+    ("coin_invoices", COINS, "purchased_at", f"'{COINS}'"),
+)
+
+# Triggers keep the rollup in the same transaction as every insert and delete.
+ROLLUP_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS {table}_rollup_insert AFTER INSERT ON {table}
+WHEN NEW.{date} IS NOT NULL
+BEGIN
+    INSERT INTO sales_rollup (year, month, kind, service, count, revenue)
+    VALUES (
+        CAST(strftime('%Y', NEW.{date}, 'unixepoch') AS INTEGER),
+        CAST(strftime('%m', NEW.{date}, 'unixepoch') AS INTEGER),
+        '{kind}', {new_service}, 1, COALESCE(NEW.amount, 0)
+    )
+    ON CONFLICT (year, month, kind, service)
+    DO UPDATE SET count = count + 1, revenue = revenue + excluded.revenue;
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_rollup_delete AFTER DELETE ON {table}
+WHEN OLD.{date} IS NOT NULL
+BEGIN
+    UPDATE sales_rollup SET count = count - 1, revenue = revenue - COALESCE(OLD.amount, 0)
+    WHERE year = CAST(strftime('%Y', OLD.{date}, 'unixepoch') AS INTEGER)
+      AND month = CAST(strftime('%m', OLD.{date}, 'unixepoch') AS INTEGER)
+      AND kind = '{kind}' AND service = {old_service};
+END;
+"""
+
+SCHEMA += "".join(
+    ROLLUP_TRIGGERS.format(
+        table=table, kind=kind, date=date,
+        new_service=service.format(row="NEW"), old_service=service.format(row="OLD")
+    )
+    for table, kind, date, service in ROLLUP_SOURCES
+)
+
+
+# (trigger name, table, date column, {staff_rollup column: value from the row}) counted per UTC day.
+STAFF_SOURCES = (
+    ("invoices_staff", "invoices", "generated_at", {"invoices": "1", "revenue": "COALESCE({row}.amount, 0)"}),
+    ("logs_staff", "logs", "generated_at", {"invoices": "1", "revenue": "COALESCE({row}.amount, 0)"}),
+    ("coin_invoices_staff", "coin_invoices", "purchased_at", {"coin_sales": "1", "coin_revenue": "COALESCE({row}.amount, 0)"}),
+    ("logs_reminders", "logs", "reminded_at", {"reminders": "1"}),
+)
+
+STAFF_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS {name}_insert AFTER INSERT ON {table}
+WHEN NEW.{date} IS NOT NULL
+BEGIN
+    INSERT INTO staff_rollup (day, staff, {columns})
+    VALUES (NEW.{date} / 86400, COALESCE(NEW.staff, 0), {new_values})
+    ON CONFLICT (day, staff) DO UPDATE SET {increments};
+END;
+CREATE TRIGGER IF NOT EXISTS {name}_delete AFTER DELETE ON {table}
+WHEN OLD.{date} IS NOT NULL
+BEGIN
+    UPDATE staff_rollup SET {decrements}
+    WHERE day = OLD.{date} / 86400 AND staff = COALESCE(OLD.staff, 0);
+END;
+"""
+
+SCHEMA += "".join(
+    STAFF_TRIGGERS.format(
+        name=name, table=table, date=date,
+        columns=", ".join(values),
+        new_values=", ".join(value.format(row="NEW") for value in values.values()),
+        increments=", ".join(f"{column} = {column} + excluded.{column}" for column in values),
+        decrements=", ".join(f"{column} = {column} - {value.format(row='OLD')}" for column, value in values.items())
+    )
+    for name, table, date, values in STAFF_SOURCES
+)
+
+
+def _statements(script):
+    """Split a SQL script into single statements, keeping trigger bodies whole (executescript would commit)."""
+    statements, current = [], ""
+    for line in script.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            statements.append(current.strip())
+            current = ""
+    return statements
+
+
+def _dump(record):
+    return json.dumps(record.to_dict(), sort_keys=True, separators=(",", ":"))
+
+
+def _with_id(record):
+    if record.id is None:
+        record.id = new_id()
+    return record
+
+
+def _invoice_row(inv):
+    return (
+        inv.id, inv.user_id, inv.service, inv.staff, inv.ingame_name, inv.amount,
+        inv.generated_at, inv.remind_at, inv.expiry, inv.idempotency_key, _dump(inv)
+    )
+
+
+def _log_row(entry):
+    return (entry.id, entry.user_id, entry.service, entry.staff, entry.amount, entry.generated_at, entry.reminded_at, _dump(entry))
+
+
+def _coin_row(entry):
+    return (entry.id, entry.user_id, entry.staff, entry.final_amount, entry.purchased_at, _dump(entry))
+
+
+INSERT_INVOICE = (
+    "INSERT INTO invoices (id, user_id, service, staff, ingame_name, amount, generated_at, remind_at, expires_at, idempotency_key, data) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+class SQLiteRepository:
+    """SQLite (WAL) implementation of the InvoiceRepository interface.
+
+    Each record is stored verbatim as JSON next to the indexed columns the
+    stats, history and reminder lookups filter on. The connection is owned
+    by a single worker thread, so queries never block the event loop and
+    never run concurrently.
+    """
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self.db = None
+        self.versions = DatasetVersions()  # bumped before each write is queued, so later reads see it
+        self.reminder_timer = DueTimer()  # poked when an invoice may bring the next reminder forward
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    def load_sync(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            if self.db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                self._upgrade()
+            self.db.executescript(SCHEMA)
+
+    def _upgrade(self):
+        """Rebuild tables from an older schema version, re-deriving every indexed column and the rollup.
+
+        Runs as one transaction: the old tables are renamed aside, the new
+        ones created and filled from them, and the old ones dropped, so a
+        crash or a failed import leaves the old database as it was.
+        """
+        tables = {"invoices": Invoice, "logs": LogEntry, "coin_invoices": CoinInvoice}
+        self.db.execute("BEGIN")
+        with self.db:
+            existing = {row[0] for row in self.db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            # Indexes and triggers follow a renamed table, so drop them to let SCHEMA recreate them
+            for kind, name in self.db.execute(
+                "SELECT type, name FROM sqlite_master WHERE type IN ('index', 'trigger') AND sql IS NOT NULL"
+            ).fetchall():
+                self.db.execute(f"DROP {kind} {name}")
+            for name in ("sales_rollup", "staff_rollup"):
+                self.db.execute(f"DROP TABLE IF EXISTS {name}")
+            old = [name for name in tables if name in existing]
+            for name in old:
+                self.db.execute(f"ALTER TABLE {name} RENAME TO old_{name}")
+            for statement in _statements(SCHEMA):
+                self.db.execute(statement)
+            records = {
+                name: [cls.from_dict(json.loads(row[0])) for row in self.db.execute(f"SELECT data FROM old_{name} ORDER BY id")]
+                for name, cls in tables.items() if name in old
+            }
+            self._replace(records.get("invoices", []), records.get("logs", []), records.get("coin_invoices", []))
+            for name in old:
+                self.db.execute(f"DROP TABLE old_{name}")
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    async def load(self):
+        await self._run(self.load_sync)
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def _fetch(self, cls, sql, params=()):
+        return [cls.from_dict(json.loads(row[0])) for row in self.db.execute(sql, params)]
+
+    def _records(self, cls, sql, params=()):
+        return self._run(self._fetch, cls, sql, params)
+
+    # --- reads ---
+
+    async def invoices(self):
+        return await self._records(Invoice, "SELECT data FROM invoices ORDER BY id")
+
+    async def logs(self):
+        return await self._records(LogEntry, "SELECT data FROM logs ORDER BY id")
+
+    async def coin_invoices(self):
+        return await self._records(CoinInvoice, "SELECT data FROM coin_invoices ORDER BY id")
+
+    async def get_invoice(self, invoice_id):
+        """The active invoice with this id, or None."""
+        found = await self._records(Invoice, "SELECT data FROM invoices WHERE id = ?", (invoice_id,))
+        return found[0] if found else None
+
+    async def open_invoices(self, user_id, service):
+        """A buyer's active invoices for one service (case-insensitive), oldest first."""
+        return await self._records(Invoice, "SELECT data FROM invoices WHERE user_id = ? AND service = ? ORDER BY id", (user_id, service))
+
+    async def get_log(self, log_id):
+        """The reminder log entry with this id (an archived invoice keeps its id), or None."""
+        found = await self._records(LogEntry, "SELECT data FROM logs WHERE id = ?", (log_id,))
+        return found[0] if found else None
+
+    async def get_coin_invoice(self, coin_invoice_id):
+        found = await self._records(CoinInvoice, "SELECT data FROM coin_invoices WHERE id = ?", (coin_invoice_id,))
+        return found[0] if found else None
+
+    async def find_invoices(self, user_id, service, ingame_name, amount):
+        return await self._records(
+            Invoice,
+            "SELECT data FROM invoices WHERE user_id = ? AND service = ? AND ingame_name = ? AND amount = ? ORDER BY id",
+            (user_id, service, ingame_name, amount)
+        )
+
+    async def invoices_for_user(self, user_id):
+        return await self._records(Invoice, "SELECT data FROM invoices WHERE user_id = ? ORDER BY generated_at, id", (user_id,))
+
+    async def logs_for_user(self, user_id):
+        return await self._records(LogEntry, "SELECT data FROM logs WHERE user_id = ? ORDER BY generated_at, id", (user_id,))
+
+    async def coin_invoices_for_user(self, user_id):
+        return await self._records(CoinInvoice, "SELECT data FROM coin_invoices WHERE user_id = ? ORDER BY purchased_at, id", (user_id,))
+
+    async def invoices_for_service(self, service):
+        return await self._records(Invoice, "SELECT data FROM invoices WHERE service = ? ORDER BY id", (service,))
+
+    async def expiring_invoices(self, service=None, until=None, offset=0, limit=10):
+        """One page of active invoices, soonest expiry first, as (invoices, total matching)."""
+        return await self._run(self._expiring_invoices, service, until, offset, limit)
+
+    def _expiring_invoices(self, service, until, offset, limit):
+        clauses, params = [], []
+        if service is not None:
+            clauses.append("service = ?")
+            params.append(service)
+        if until is not None:
+            clauses.append("expires_at < ?")
+            params.append(until)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        total = self.db.execute(f"SELECT COUNT(*) FROM invoices{where}", params).fetchone()[0]
+        page = self._fetch(
+            Invoice, f"SELECT data FROM invoices{where} ORDER BY expires_at IS NULL, expires_at, id LIMIT ? OFFSET ?", params + [limit, offset]
+        )
+        return page, total
+
+    async def due_invoices(self, now):
+        return await self._records(Invoice, "SELECT data FROM invoices WHERE remind_at <= ? ORDER BY remind_at", (now,))
+
+    async def next_reminder(self):
+        """Earliest reminder epoch among the active invoices (the remind_at index head), or None."""
+        return await self._run(lambda: self.db.execute("SELECT MIN(remind_at) FROM invoices").fetchone()[0])
+
+    async def stream_records(self, dataset, start=None, end=None, user_id=None):
+        """Yield batches of "invoices", "logs" or "coin_invoices" records, one keyset page (by id) per query."""
+        cls, date_column = {
+            "invoices": (Invoice, "generated_at"), "logs": (LogEntry, "generated_at"), "coin_invoices": (CoinInvoice, "purchased_at")
+        }[dataset]
+        clauses, params = [], []
+        if start is not None:
+            clauses.append(f"{date_column} >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append(f"{date_column} < ?")
+            params.append(end)
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        sql = f"SELECT id, data FROM {dataset} WHERE " + " AND ".join(clauses + ["id > ?"]) + " ORDER BY id LIMIT ?"
+        last_id = 0
+        while True:
+            last_id, records = await self._run(self._stream_page, cls, sql, params + [last_id, STREAM_BATCH])
+            if not records:
+                return
+            yield records
+
+    def _stream_page(self, cls, sql, params):
+        rows = self.db.execute(sql, params).fetchall()
+        return (rows[-1][0] if rows else None), [cls.from_dict(json.loads(data)) for _id, data in rows]
+
+    async def sales(self, start=None, end=None):
+        """Return (type, epoch, amount, service, staff) for every sale dated in [start, end) epoch seconds."""
+        return await self._run(self._sales, start, end)
+
+    def _sales(self, start, end):
+        lo = start if start is not None else -2 ** 63
+        hi = end if end is not None else 2 ** 63 - 1
+        queries = (
+            (ACTIVE, "SELECT generated_at, amount, service, staff FROM invoices WHERE generated_at >= ? AND generated_at < ?"),
+            (LOGGED, "SELECT generated_at, amount, service, staff FROM logs WHERE generated_at >= ? AND generated_at < ?"),
+            (COINS, f"SELECT purchased_at, amount, '{COINS}', staff FROM coin_invoices WHERE purchased_at >= ? AND purchased_at < ?"),
+        )
+        return [
+            (kind, date, amount, service, staff)
+            for kind, sql in queries
+            for date, amount, service, staff in self.db.execute(sql, (lo, hi))
+        ]
+
+    async def sales_summary(self, year=None, month=None):
+        """Return {type: [count, revenue]} for a year and/or month (UTC) from the rollup table."""
+        return await self._run(self._sales_summary, year, month)
+
+    def _sales_summary(self, year, month):
+        rows = self.db.execute(
+            "SELECT kind, SUM(count), SUM(revenue) FROM sales_rollup "
+            "WHERE (? IS NULL OR year = ?) AND (? IS NULL OR month = ?) GROUP BY kind",
+            (year, year, month, month)
+        )
+        return {kind: [count, revenue] for kind, count, revenue in rows}
+
+    async def staff_summary(self, start=None, end=None, month=None):
+        """Return {staff id (0 = unknown): [invoices, revenue, coin sales, coin revenue, reminders]}.
+
+        Counted per UTC day: days overlapping [start, end) count whole; month matches every year.
+        """
+        return await self._run(self._staff_summary, start, end, month)
+
+    def _staff_summary(self, start, end, month):
+        first = start // 86400 if start is not None else -2 ** 63
+        last = -(-end // 86400) if end is not None else 2 ** 63 - 1
+        rows = self.db.execute(
+            "SELECT staff, SUM(invoices), SUM(revenue), SUM(coin_sales), SUM(coin_revenue), SUM(reminders) "
+            "FROM staff_rollup WHERE day >= ? AND day < ? "
+            "AND (? IS NULL OR CAST(strftime('%m', day * 86400, 'unixepoch') AS INTEGER) = ?) GROUP BY staff",
+            (first, last, month, month)
+        )
+        return {row[0]: list(row[1:]) for row in rows}
+
+    async def rebuild_sales(self):
+        """Recount the sales and staff rollups from every stored record."""
+        await self._run(self._write, self._rebuild_sales)
+
+    def _rebuild_sales(self):
+        self.db.execute("DELETE FROM sales_rollup")
+        for table, kind, date, service in ROLLUP_SOURCES:
+            service = service.format(row=table)
+            self.db.execute(
+                f"INSERT INTO sales_rollup (year, month, kind, service, count, revenue) "
+                f"SELECT CAST(strftime('%Y', {date}, 'unixepoch') AS INTEGER) AS y, "
+                f"CAST(strftime('%m', {date}, 'unixepoch') AS INTEGER) AS m, ?, {service} AS s, "
+                f"COUNT(*), SUM(COALESCE(amount, 0)) "
+                f"FROM {table} WHERE {date} IS NOT NULL GROUP BY y, m, s",
+                (kind,)
+            )
+        self.db.execute("DELETE FROM staff_rollup")
+        for _name, table, date, values in STAFF_SOURCES:
+            self.db.execute(
+                f"INSERT INTO staff_rollup (day, staff, {', '.join(values)}) "
+                f"SELECT {date} / 86400 AS d, COALESCE(staff, 0) AS st, "
+                f"{', '.join('SUM(' + value.format(row=table) + ')' for value in values.values())} "
+                f"FROM {table} WHERE {date} IS NOT NULL GROUP BY d, st "
+                f"ON CONFLICT (day, staff) DO UPDATE SET "
+                f"{', '.join(f'{column} = {column} + excluded.{column}' for column in values)}"
+            )
+
+    # --- writes ---
+
+    def _delete_invoices(self, invoices):
+        """Delete each invoice once; returns the ones that were still present."""
+        deleted = []
+        for inv in invoices:
+            if self.db.execute("DELETE FROM invoices WHERE id = ?", (inv.id,)).rowcount:
+                deleted.append(inv)
+        return deleted
+
+    async def add_invoice(self, invoice, idempotency_key=None):
+        """Store a new invoice and return (invoice, True).
+
+        If an active invoice was already created with idempotency_key, nothing
+        is stored and (that invoice, False) is returned instead.
+        """
+        if idempotency_key is not None:
+            invoice.idempotency_key = idempotency_key
+        self.versions.bump("invoices")
+        stored, created = await self._run(self._add_invoice, _with_id(invoice))
+        if created:
+            self.reminder_timer.poke()
+        return stored, created
+
+    def _add_invoice(self, invoice):
+        if invoice.idempotency_key is not None:
+            found = self._fetch(Invoice, "SELECT data FROM invoices WHERE idempotency_key = ?", (invoice.idempotency_key,))
+            if found:
+                return found[0], False
+        with self.db:
+            self.db.execute(INSERT_INVOICE, _invoice_row(invoice))
+        return invoice, True
+
+    async def remove_invoices(self, invoices):
+        self.versions.bump("invoices")
+        await self._run(self._write, self._delete_invoices, list(invoices))
+
+    async def archive_invoices(self, invoices):
+        self.versions.bump("invoices", "logs")
+        await self._run(self._archive, list(invoices))
+
+    def _archive(self, invoices):
+        with self.db:
+            archived = self._delete_invoices(invoices)
+            reminded_at = now_epoch()
+            self._insert_logs([LogEntry.from_invoice(inv, reminded_at=reminded_at) for inv in archived])
+
+    def _write(self, func, *args):
+        with self.db:
+            func(*args)
+
+    def _insert_logs(self, entries):
+        self.db.executemany(
+            "INSERT INTO logs (id, user_id, service, staff, amount, generated_at, reminded_at, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [_log_row(_with_id(e)) for e in entries]
+        )
+
+    async def add_log(self, entry):
+        self.versions.bump("logs")
+        await self._run(self._write, self._insert_logs, [entry])
+
+    async def add_coin_invoice(self, entry):
+        self.versions.bump("coin_invoices")
+        await self._run(self._write, self._insert_coin_invoices, [entry])
+
+    def _insert_coin_invoices(self, entries):
+        self.db.executemany(
+            "INSERT INTO coin_invoices (id, user_id, staff, amount, purchased_at, data) VALUES (?, ?, ?, ?, ?, ?)",
+            [_coin_row(_with_id(e)) for e in entries]
+        )
+
+    def import_json(self, invoices, logs, coin_invoices):
+        """Replace the database contents with the given typed records; records without an id get one."""
+        self.load_sync()
+        with self.db:
+            self._replace(invoices, logs, coin_invoices)
+
+    def _replace(self, invoices, logs, coin_invoices):
+        self.db.execute("DELETE FROM invoices")
+        self.db.execute("DELETE FROM logs")
+        self.db.execute("DELETE FROM coin_invoices")
+        self.db.executemany(INSERT_INVOICE, [_invoice_row(_with_id(inv)) for inv in invoices])
+        self._insert_logs(logs)
+        self._insert_coin_invoices(coin_invoices)
+        self._rebuild_sales()
+
+
+def migrate_from_json(db_path=DB_FILE):
+    """One-shot import of data/*.json into the SQLite database."""
+    from utils.storage import InvoiceRepository
+
+    async def read_all():
+        source = InvoiceRepository()
+        await source.load()
+        return await source.invoices(), await source.logs(), await source.coin_invoices()
+
+    datasets = asyncio.run(read_all())
+    repo = SQLiteRepository(db_path)
+    repo.import_json(*datasets)
+    repo.close()
+    return tuple(len(records) for records in datasets)
+
+
+if __name__ == "__main__":
+    counts = migrate_from_json(sys.argv[1] if len(sys.argv) > 1 else DB_FILE)
+    print("Imported {} invoices, {} logs and {} coin invoices.".format(*counts))
@@ -0,0 +1,618 @@
+import asyncio
+import os
+from collections import OrderedDict
+import configs
+from utils.fileio import read_json_file, write_json_file, run_io
+from utils.journal import Journal
+from utils.records import Invoice, LogEntry, CoinInvoice, decode_records, encode_records, now_epoch
+from utils.segments import SegmentStore
+from utils.rollups import SalesRollup, StaffRollup, sale_of, ACTIVE, LOGGED, COINS
+from utils.timeindex import SaleTimeIndex, ExpiryIndex
+from utils.cache import DatasetVersions
+from utils.scheduler import DueQueue, DueTimer
+from utils.ids import new_id
+
+INVOICES_FILE = "./data/invoices.json"
+LOGS_DIR = "./data/logs"
+COIN_INVOICES_DIR = "./data/coin_invoices"
+SALES_ROLLUP_FILE = "./data/sales_rollup.json"
+SALES_ROLLUP_JOURNAL_FILE = "./data/sales_rollup.jsonl"
+STAFF_ROLLUP_FILE = "./data/staff_rollup.json"
+STAFF_ROLLUP_JOURNAL_FILE = "./data/staff_rollup.jsonl"
+JOURNAL_FILE = "journal.jsonl"
+# Single-file layouts from before segments; imported once when a segment manifest is missing.
+LEGACY_LOGS_FILE = "./data/logs.json"
+LEGACY_LOGS_JOURNAL_FILE = "./data/logs.jsonl"
+LEGACY_COIN_INVOICES_FILE = "./data/coin_invoices.json"
+COMPACT_THRESHOLD = 500  # journal lines before they are folded into segments
+ROLLUP_COMPACT_THRESHOLD = 500  # rollup journal lines before the counters are rewritten whole
+SEGMENT_CACHE_SIZE = 12  # decoded monthly segments kept in memory per dataset
+COMMIT_WINDOW = 0.05  # seconds a save waits so concurrent mutations share one write
+STREAM_BATCH = 500  # records per batch yielded by stream_records
+DATASET_OF = {ACTIVE: "invoices", LOGGED: "logs", COINS: "coin_invoices"}
+
+
+class Dataset:
+    """A JSON list file that is parsed once and then served from memory.
+
+    Saves are group-committed: every save requested within COMMIT_WINDOW
+    resolves on the same atomic temp-file-and-rename write, and the dataset
+    lock keeps those writes strictly ordered.
+    """
+
+    def __init__(self, path, record_type):
+        self.path = path
+        self.record_type = record_type
+        self.records = []
+        self.lock = asyncio.Lock()
+        self.writes = 0
+        self._commit = None
+
+    def load(self):
+        self.records = decode_records(read_json_file(self.path, []), self.record_type)
+
+    async def save(self):
+        if self._commit is None:
+            self._commit = asyncio.ensure_future(self._group_commit())
+        await asyncio.shield(self._commit)
+
+    async def _group_commit(self):
+        await asyncio.sleep(COMMIT_WINDOW)
+        async with self.lock:
+            # Saves arriving from here on belong to the next group.
+            self._commit = None
+            await self._flush()
+            self.writes += 1
+
+    async def _flush(self):
+        await run_io(self._write, list(self.records))
+
+    def _write(self, records):
+        write_json_file(self.path, encode_records(records))
+
+    async def extend(self, records):
+        self.records.extend(records)
+        await self.save()
+
+
+class SegmentedDataset(Dataset):
+    """An append-only dataset kept as monthly segment files (see SegmentStore).
+
+    New records are appended to a JSONL journal and stay in memory as the
+    tail; once the journal reaches COMPACT_THRESHOLD lines a background task
+    folds the tail into its segments. Reads only open the segments whose
+    manifest dates overlap the query and keep a few decoded ones cached.
+    """
+
+    def __init__(self, directory, record_type, date_field, amount_field, fallback_fields=()):
+        super().__init__(directory, record_type)
+        self.store = SegmentStore(directory, date_field, amount_field, fallback_fields)
+        self.journal = Journal(os.path.join(directory, JOURNAL_FILE))
+        self._journaled = 0
+        self._compacting = None
+        self._cache = OrderedDict()
+        self._tail_ids = {}  # record id -> record, for the tail not yet folded
+        self.total = 0  # records ever appended, folded or not
+
+    def load(self, legacy=list):
+        """Load the manifest and journal tail; legacy() supplies the records of a pre-segment file.
+
+        Records from before ids (legacy files, an old journal tail) get one
+        as they are folded; such a tail is folded right away so the ids stick.
+        """
+        had_manifest = self.store.exists()
+        self.store.load()
+        if not had_manifest:
+            self._fold(decode_records(legacy(), self.record_type))
+        self.records = decode_records(self.journal.replay(self.store.count), self.record_type)
+        if any(record.id is None for record in self.records):
+            self._fold(self.records)
+            self.records = []
+        self._journaled = len(self.records)
+        self._tail_ids = {record.id: record for record in self.records}
+        self.total = self.store.count + len(self.records)
+
+    async def _flush(self):
+        # Records are only ever appended, so everything past _journaled is new.
+        start, end = self._journaled, len(self.records)
+        if start < end:
+            await run_io(self._append, self.store.count + start, self.records[start:end])
+            self._journaled = end
+
+    async def extend(self, records):
+        self.records.extend(records)
+        self._tail_ids.update((record.id, record) for record in records)
+        self.total += len(records)
+        await self.save()
+        if self.journal.pending >= COMPACT_THRESHOLD and (self._compacting is None or self._compacting.done()):
+            self._compacting = asyncio.ensure_future(self.compact())
+
+    async def compact(self):
+        async with self.lock:
+            await self._flush()
+            folded = self.records[:self._journaled]
+            keys = await run_io(self._fold, folded)
+            del self.records[:len(folded)]
+            self._journaled -= len(folded)
+            for record, key in zip(folded, keys):
+                self._tail_ids.pop(record.id, None)
+                cached = self._cache.get(key)
+                if cached is not None:
+                    cached.append(record)
+
+    async def scan(self, start=None, end=None):
+        """Records from every segment overlapping [start, end) plus the tail; callers still filter by date."""
+        async with self.lock:
+            result = []
+            for key in self.store.keys_between(start, end):
+                result.extend(await self._segment(key))
+            result.extend(self.records)
+            return result
+
+    async def stream(self, start=None, end=None):
+        """Yield the records of segments overlapping [start, end) one segment at a time, then the tail.
+
+        Segment counts and the tail are captured up front, so a fold running
+        meanwhile neither drops nor repeats records. Callers still filter by date.
+        """
+        async with self.lock:
+            keys = self.store.keys_between(start, end)
+            counts = {key: self.store.manifest["segments"][key]["count"] for key in keys}
+            tail = list(self.records)
+        for key, count in counts.items():
+            # Cached segments are reused, but a one-off export does not push hot months out of the cache
+            records = self._cache.get(key)
+            if records is None:
+                records = await run_io(self._read, key)
+            yield records[:count]
+        yield tail
+
+    async def for_user(self, user_id):
+        """One user's records, oldest first: only the segments holding them are read (see SegmentStore), plus the tail."""
+        async with self.lock:
+            refs = list(self.store.user_refs(user_id))
+            tail = [record for record in self.records if record.user_id == user_id]
+            segments = {}
+            for key in {key for _date, _seq, key, _position in refs}:
+                # Like stream(), one user's history does not push hot months out of the cache
+                segments[key] = self._cache.get(key)
+                if segments[key] is None:
+                    segments[key] = await run_io(self._read, key)
+        return [segments[key][position] for _date, _seq, key, position in refs] + tail
+
+    async def get(self, record_id):
+        """The record with this id, or None: a dict lookup, plus its segment once it is folded."""
+        async with self.lock:
+            record = self._tail_ids.get(record_id)
+            if record is not None:
+                return record
+            ref = self.store.id_ref(record_id)
+            if ref is None:
+                return None
+            key, position = ref
+            return (await self._segment(key))[position]
+
+    async def _segment(self, key):
+        records = self._cache.get(key)
+        if records is None:
+            records = await run_io(self._read, key)
+            self._cache[key] = records
+            if len(self._cache) > SEGMENT_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        self._cache.move_to_end(key)
+        return records
+
+    def _read(self, key):
+        return [self.record_type.from_dict(item) for item in self.store.read(key)]
+
+    def _append(self, start, records):
+        self.journal.append(start, [record.to_dict() for record in records])
+
+    def _fold(self, records):
+        for record in records:
+            if record.id is None:
+                record.id = new_id()
+        keys = self.store.fold([record.to_dict() for record in records])
+        self.journal.truncate(self.store.count)
+        return keys
+
+
+class RollupDataset(Dataset):
+    """A set of rollup counters, persisted with the same group commit as the records.
+
+    A commit appends one journal line with the rows it changed, so its cost
+    does not grow with the table; after ROLLUP_COMPACT_THRESHOLD lines, or
+    when the counters are replaced, the whole table is rewritten and the
+    journal cut. Each write also stores sources(), a stamp of the record
+    datasets the counters were computed from; the repository rebuilds the
+    rollup on load when it does not match the records actually loaded
+    (e.g. after a crash between a record write and the rollup write).
+    """
+
+    def __init__(self, path, journal_path, rollup_type, sources):
+        super().__init__(path, None)
+        self.journal = Journal(journal_path)
+        self.rollup_type = rollup_type
+        self.rollup = rollup_type()
+        self.sources = sources
+        self.stamp = None  # sources() as of the last write
+        self._lines = 0  # journal lines written, including those folded into path
+        self._rewrite = False
+
+    def load(self):
+        data = read_json_file(self.path) or {}
+        self.rollup = self.rollup_type.from_dict(data)
+        self.stamp = data.get("sources")
+        self._lines = data.get("lines", 0)
+        for change in self.journal.replay(self._lines):
+            self.rollup.apply(change["counters"])
+            self.stamp = change["sources"]
+            self._lines += 1
+        self.rollup.changed = set()
+
+    def replace(self, rollup):
+        """Swap in recounted counters; the next commit rewrites the file."""
+        self.rollup = rollup
+        self._rewrite = True
+
+    async def _flush(self):
+        rows = self.rollup.take_changes()
+        sources = self.sources()
+        if self._rewrite or self.journal.pending >= ROLLUP_COMPACT_THRESHOLD:
+            self._rewrite = False
+            await run_io(self._write_all, dict(self.rollup.to_dict(), sources=sources, lines=self._lines))
+        elif rows or sources != self.stamp:
+            await run_io(self.journal.append, self._lines, [{"counters": rows, "sources": sources}])
+            self._lines += 1
+        self.stamp = sources
+
+    def _write_all(self, data):
+        write_json_file(self.path, data)
+        self.journal.truncate(data["lines"])
+
+
+def _sales_of(kind, records):
+    """Sale tuples (type, epoch, amount, service, staff) for the dated records."""
+    result = []
+    for record in records:
+        ts, service, amount = sale_of(kind, record)
+        if ts is not None:
+            result.append((kind, ts, amount, service, record.staff))
+    return result
+
+
+def _legacy_logs():
+    """logs.json plus its logs.jsonl tail, the layout used before segments."""
+    snapshot = read_json_file(LEGACY_LOGS_FILE, [])
+    if isinstance(snapshot, dict):
+        snapshot = snapshot.get("records", [])
+    return snapshot + Journal(LEGACY_LOGS_JOURNAL_FILE).replay(len(snapshot))
+
+
+def _legacy_coin_invoices():
+    return read_json_file(LEGACY_COIN_INVOICES_FILE, [])
+
+
+class InvoiceRepository:
+    """Process-wide store for invoices, reminder logs and coin invoices.
+
+    Active invoices are decoded into typed records once and served from
+    memory (dates are epoch seconds, so nothing is re-parsed). Logs and coin
+    invoices only grow, so they live in monthly segments that are opened on
+    demand. Each mutation persists the affected files, so cogs never touch
+    them. The API is async so the SQLite backend can run its queries off
+    the loop.
+    """
+
+    def __init__(self):
+        self._invoices = Dataset(INVOICES_FILE, Invoice)
+        # Manual reminder logs have no generated_at; they are filed by when they were sent
+        self._logs = SegmentedDataset(LOGS_DIR, LogEntry, "generated_at", "amount", ("reminded_at", "purchased_at"))
+        self._coin_invoices = SegmentedDataset(COIN_INVOICES_DIR, CoinInvoice, "purchased_at", "final_amount")
+        self._sales = RollupDataset(SALES_ROLLUP_FILE, SALES_ROLLUP_JOURNAL_FILE, SalesRollup, self._sources)
+        self._staff = RollupDataset(STAFF_ROLLUP_FILE, STAFF_ROLLUP_JOURNAL_FILE, StaffRollup, self._sources)
+        self._active_by_user = {}
+        self._by_id = {}  # invoice id -> active invoice
+        self._open_by_buyer = {}  # (user_id, lowercased service) -> active invoices
+        self._by_key = {}  # idempotency key -> the active invoice created with it
+        self._id_sum = 0  # sum of the active invoice ids, part of the rollup source stamp
+        self._ids_assigned = False
+        self._expiry = ExpiryIndex()
+        self._reminders = DueQueue()
+        self.reminder_timer = DueTimer()  # poked when an invoice may bring the next reminder forward
+        self._time_index = None
+        self._sales_version = 0  # bumped by every write, so a stale index build is retried
+        self.versions = DatasetVersions()  # per-dataset write counters for cached command results
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+
+    def load_sync(self):
+        self._invoices.load()
+        # Invoices from before ids get one now; load() saves them so the ids stick
+        missing = [inv for inv in self._invoices.records if inv.id is None]
+        for inv in missing:
+            inv.id = new_id()
+        self._ids_assigned = bool(missing)
+        self._active_by_user, self._by_id, self._open_by_buyer, self._by_key = {}, {}, {}, {}
+        self._id_sum = 0
+        for inv in self._invoices.records:
+            self._index(inv)
+        self._expiry = ExpiryIndex(self._invoices.records)
+        self._reminders = DueQueue((inv.remind_at, inv) for inv in self._invoices.records)
+        self._logs.load(_legacy_logs)
+        self._coin_invoices.load(_legacy_coin_invoices)
+        self._sales.load()
+        self._staff.load()
+        self._loaded = True
+
+    async def load(self):
+        """Parse every dataset in the I/O pool; only the first call does any work."""
+        async with self._load_lock:
+            if not self._loaded:
+                await run_io(self.load_sync)
+                if self._ids_assigned:
+                    await self._invoices.save()
+                if self._sales.stamp != self._sources() or self._staff.stamp != self._sources():
+                    await self.rebuild_sales()
+
+    def _sources(self):
+        """Stamp of the records the rollups count: active invoice count and id sum, log and coin invoice totals."""
+        return {
+            "invoices": [len(self._by_id), self._id_sum],
+            "logs": self._logs.total,
+            "coin_invoices": self._coin_invoices.total,
+        }
+
+    def _index(self, inv):
+        self._active_by_user.setdefault(inv.user_id, []).append(inv)
+        self._by_id[inv.id] = inv
+        self._id_sum += inv.id
+        self._open_by_buyer.setdefault((inv.user_id, (inv.service or "").lower()), []).append(inv)
+        if inv.idempotency_key is not None:
+            self._by_key[inv.idempotency_key] = inv
+
+    def _unindex(self, inv):
+        self._active_by_user[inv.user_id].remove(inv)
+        del self._by_id[inv.id]
+        self._id_sum -= inv.id
+        self._open_by_buyer[(inv.user_id, (inv.service or "").lower())].remove(inv)
+        if self._by_key.get(inv.idempotency_key) is inv:
+            del self._by_key[inv.idempotency_key]
+
+    # --- reads (returned records are shared, treat them as read-only) ---
+
+    async def invoices(self):
+        return self._invoices.records
+
+    async def logs(self):
+        return await self._logs.scan()
+
+    async def coin_invoices(self):
+        return await self._coin_invoices.scan()
+
+    async def get_invoice(self, invoice_id):
+        """The active invoice with this id, or None."""
+        return self._by_id.get(invoice_id)
+
+    async def open_invoices(self, user_id, service):
+        """A buyer's active invoices for one service (case-insensitive), oldest first."""
+        return list(self._open_by_buyer.get((user_id, service.lower()), []))
+
+    async def find_invoices(self, user_id, service, ingame_name, amount):
+        ingame_name = ingame_name.lower()
+        return [
+            inv for inv in self._open_by_buyer.get((user_id, service.lower()), [])
+            if (inv.ingame_name or "").lower() == ingame_name and inv.amount == amount
+        ]
+
+    async def invoices_for_user(self, user_id):
+        return list(self._active_by_user.get(user_id, []))
+
+    async def logs_for_user(self, user_id):
+        return await self._logs.for_user(user_id)
+
+    async def coin_invoices_for_user(self, user_id):
+        return await self._coin_invoices.for_user(user_id)
+
+    async def get_log(self, log_id):
+        """The reminder log entry with this id (an archived invoice keeps its id), or None."""
+        return await self._logs.get(log_id)
+
+    async def get_coin_invoice(self, coin_invoice_id):
+        return await self._coin_invoices.get(coin_invoice_id)
+
+    async def invoices_for_service(self, service):
+        service = service.lower()
+        return [inv for inv in self._invoices.records if (inv.service or "").lower() == service]
+
+    async def expiring_invoices(self, service=None, until=None, offset=0, limit=10):
+        """One page of active invoices, soonest expiry first, as (invoices, total matching).
+
+        service filters by name (case-insensitive); until keeps only invoices
+        expiring before that epoch, already expired ones included.
+        """
+        return self._expiry.page(service, until, offset, limit)
+
+    async def due_invoices(self, now):
+        """Invoices whose reminder epoch is at or before now, soonest first."""
+        return self._reminders.due(now)
+
+    async def next_reminder(self):
+        """Earliest reminder epoch among the active invoices, or None."""
+        return self._reminders.next_due()
+
+    async def stream_records(self, dataset, start=None, end=None, user_id=None):
+        """Yield batches of "invoices", "logs" or "coin_invoices" records that may match; callers still filter.
+
+        Only one batch (or one monthly segment) is decoded at a time, so an
+        export never holds the whole dataset.
+        """
+        if dataset == "invoices":
+            records = self._active_by_user.get(user_id, []) if user_id is not None else self._invoices.records
+            records = list(records)
+            for i in range(0, len(records), STREAM_BATCH):
+                yield records[i:i + STREAM_BATCH]
+            return
+        segmented = self._logs if dataset == "logs" else self._coin_invoices
+        if user_id is not None:
+            yield await segmented.for_user(user_id)
+            return
+        async for records in segmented.stream(start, end):
+            for i in range(0, len(records), STREAM_BATCH):
+                yield records[i:i + STREAM_BATCH]
+
+    async def sales(self, start=None, end=None):
+        """Return (type, epoch, amount, service, staff) for every sale dated in [start, end) epoch seconds.
+
+        Served from a sorted time index that is built on first use and then
+        kept up to date by the writes.
+        """
+        while self._time_index is None:
+            version = self._sales_version
+            logs, coins = await asyncio.gather(self._logs.scan(), self._coin_invoices.scan())
+            if version == self._sales_version:
+                self._time_index = SaleTimeIndex(
+                    _sales_of(ACTIVE, self._invoices.records) + _sales_of(LOGGED, logs) + _sales_of(COINS, coins)
+                )
+        return self._time_index.between(start, end)
+
+    async def sales_summary(self, year=None, month=None):
+        """Return {type: [count, revenue]} for a year and/or month (UTC) from the rollup counters."""
+        return self._sales.rollup.summary(year, month)
+
+    async def staff_summary(self, start=None, end=None, month=None):
+        """Return {staff id (0 = unknown): [invoices, revenue, coin sales, coin revenue, reminders]}.
+
+        Counted per UTC day: days overlapping [start, end) count whole; month matches every year.
+        """
+        return self._staff.rollup.summary(start, end, month)
+
+    async def rebuild_sales(self):
+        """Recount the sales and staff rollups from every stored record."""
+        while True:
+            version = self._sales_version
+            logs, coins = await asyncio.gather(self._logs.scan(), self._coin_invoices.scan())
+            if version == self._sales_version:
+                break
+        rollup, staff = SalesRollup(), StaffRollup()
+        for kind, records in ((ACTIVE, self._invoices.records), (LOGGED, logs), (COINS, coins)):
+            rollup.add(kind, records)
+            staff.add_sales(kind, records)
+        staff.add_reminders(logs)
+        self._sales.replace(rollup)
+        self._staff.replace(staff)
+        self._time_index = None
+        await self._save_rollups()
+
+    def _count_sales(self, kind, records, sign=1):
+        """Apply written records to the sales and staff rollups and the time index; sign=-1 takes them out."""
+        self._sales_version += 1
+        self.versions.bump(DATASET_OF[kind])
+        self._sales.rollup.add(kind, records, sign)
+        self._staff.rollup.add_sales(kind, records, sign)
+        if kind == LOGGED:
+            self._staff.rollup.add_reminders(records, sign)
+        if self._time_index is not None:
+            if sign > 0:
+                self._time_index.add(_sales_of(kind, records))
+            else:
+                self._time_index.remove(_sales_of(kind, records))
+
+    async def _save_rollups(self):
+        await asyncio.gather(self._sales.save(), self._staff.save())
+
+    # --- writes ---
+
+    async def add_invoice(self, invoice, idempotency_key=None):
+        """Store a new invoice and return (invoice, True).
+
+        If an active invoice was already created with idempotency_key, nothing
+        is stored and (that invoice, False) is returned instead.
+        """
+        if idempotency_key is not None:
+            existing = self._by_key.get(idempotency_key)
+            if existing is not None:
+                return existing, False
+            invoice.idempotency_key = idempotency_key
+        if invoice.id is None:
+            invoice.id = new_id()
+        self._index(invoice)
+        self._expiry.add(invoice)
+        self._reminders.push(invoice.remind_at, invoice)
+        self.reminder_timer.poke()
+        self._count_sales(ACTIVE, [invoice])
+        await asyncio.gather(self._invoices.extend([invoice]), self._save_rollups())
+        return invoice, True
+
+    def _active(self, invoices):
+        """The stored active invoices with the ids of invoices, each once."""
+        found = {}
+        for inv in invoices:
+            stored = self._by_id.get(inv.id)
+            if stored is not None:
+                found[inv.id] = stored
+        return list(found.values())
+
+    def _take(self, invoices):
+        """Drop the still-active ones of invoices from memory, the indexes and the rollups; returns them.
+
+        Synchronous, so callers can act on exactly what was removed before
+        anything else runs.
+        """
+        removed = self._active(invoices)
+        if not removed:
+            return []
+        drop = {inv.id for inv in removed}
+        # The list rebuild is a memory pass; the file is rewritten whole either way
+        self._invoices.records = [inv for inv in self._invoices.records if inv.id not in drop]
+        for inv in removed:
+            self._unindex(inv)
+            self._expiry.remove(inv)
+            self._reminders.discard(inv)
+        self._count_sales(ACTIVE, removed, -1)
+        return removed
+
+    async def remove_invoices(self, invoices):
+        if self._take(invoices):
+            await asyncio.gather(self._invoices.save(), self._save_rollups())
+
+    async def archive_invoices(self, invoices):
+        """Move invoices from the active list into the reminder logs, stamped as reminded now.
+
+        Invoices already removed elsewhere (e.g. by /reminder while the caller
+        was sending DMs) are skipped so they are not logged twice.
+        """
+        removed = self._take(invoices)
+        if not removed:
+            return
+        reminded_at = now_epoch()
+        entries = [LogEntry.from_invoice(inv, reminded_at=reminded_at) for inv in removed]
+        self._count_sales(LOGGED, entries)
+        await asyncio.gather(self._invoices.save(), self._logs.extend(entries), self._save_rollups())
+
+    async def add_log(self, entry):
+        if entry.id is None:
+            entry.id = new_id()
+        self._count_sales(LOGGED, [entry])
+        await asyncio.gather(self._logs.extend([entry]), self._save_rollups())
+
+    async def add_coin_invoice(self, entry):
+        if entry.id is None:
+            entry.id = new_id()
+        self._count_sales(COINS, [entry])
+        await asyncio.gather(self._coin_invoices.extend([entry]), self._save_rollups())
+
+
+_repository = None
+
+
+def get_repository():
+    """Return the shared repository, using configs.STORAGE_BACKEND ("json" or "sqlite")."""
+    global _repository
+    if _repository is None:
+        if getattr(configs, "STORAGE_BACKEND", "json") == "sqlite":
+            from utils.sqlite_store import SQLiteRepository
+            _repository = SQLiteRepository()
+        else:
+            _repository = InvoiceRepository()
+    return _repository
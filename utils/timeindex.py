@@ -0,0 +1,108 @@
+import bisect
+import time
+
+
+class SaleTimeIndex:
+    """Every sale tuple (type, epoch, amount, service, staff), kept sorted by epoch.
+
+    Range queries are two bisects and a slice, so their cost follows the
+    number of sales in the window rather than the size of the store.
+    """
+
+    def __init__(self, sales=()):
+        self.sales = sorted(sales, key=lambda sale: sale[1])
+        self.epochs = [sale[1] for sale in self.sales]
+
+    def __len__(self):
+        return len(self.sales)
+
+    def add(self, sales):
+        for sale in sales:
+            position = bisect.bisect_right(self.epochs, sale[1])
+            self.epochs.insert(position, sale[1])
+            self.sales.insert(position, sale)
+
+    def remove(self, sales):
+        for sale in sales:
+            lo = bisect.bisect_left(self.epochs, sale[1])
+            hi = bisect.bisect_right(self.epochs, sale[1], lo)
+            for position in range(lo, hi):
+                if self.sales[position] == sale:
+                    del self.sales[position]
+                    del self.epochs[position]
+                    break
+
+    def between(self, start=None, end=None):
+        """Sales dated in [start, end); None bounds are open."""
+        lo = 0 if start is None else bisect.bisect_left(self.epochs, start)
+        hi = len(self.epochs) if end is None else bisect.bisect_left(self.epochs, end, lo)
+        return self.sales[lo:hi]
+
+
+def group_sales(sales, by):
+    """Return [(label, count, revenue)] grouped by "service", "staff" or "day".
+
+    Services and staff come highest revenue first, with staff labelled by id
+    (None when unknown); days are "YYYY-MM-DD" (UTC) in date order.
+    """
+    groups = {}
+    for _kind, ts, amount, service, staff in sales:
+        if by == "service":
+            label = service or "Unknown"
+        elif by == "staff":
+            label = staff
+        else:
+            label = time.strftime("%Y-%m-%d", time.gmtime(ts))
+        group = groups.setdefault(label, [0, 0])
+        group[0] += 1
+        group[1] += amount or 0
+    if by == "day":
+        return [(label, count, revenue) for label, (count, revenue) in sorted(groups.items())]
+    return sorted(((label, count, revenue) for label, (count, revenue) in groups.items()), key=lambda g: -g[2])
+
+
+class ExpiryIndex:
+    """Active invoices ordered by expiry (soonest first), overall and per service.
+
+    Each bucket keeps sorted (expiry, seq) keys next to the invoices, so a
+    page is a bisect plus a slice of the page size.
+    """
+
+    def __init__(self, invoices=()):
+        self._keys = {None: []}
+        self._invoices = {None: []}
+        self._key_of = {}  # id(invoice) -> its sort key
+        self._seq = 0
+        for inv in invoices:
+            self.add(inv)
+
+    def _buckets(self, inv):
+        return (None, (inv.service or "").lower())
+
+    def add(self, inv):
+        expiry = inv.expiry
+        key = (expiry if expiry is not None else float("inf"), self._seq)
+        self._seq += 1
+        self._key_of[id(inv)] = key
+        for bucket in self._buckets(inv):
+            keys = self._keys.setdefault(bucket, [])
+            position = bisect.bisect_left(keys, key)
+            keys.insert(position, key)
+            self._invoices.setdefault(bucket, []).insert(position, inv)
+
+    def remove(self, inv):
+        key = self._key_of.pop(id(inv), None)
+        if key is None:
+            return
+        for bucket in self._buckets(inv):
+            keys = self._keys[bucket]
+            position = bisect.bisect_left(keys, key)
+            del keys[position]
+            del self._invoices[bucket][position]
+
+    def page(self, service=None, until=None, offset=0, limit=10):
+        """Return (invoices, total) for one page, optionally only those expiring before until."""
+        bucket = service.lower() if service is not None else None
+        keys = self._keys.get(bucket, [])
+        total = len(keys) if until is None else bisect.bisect_left(keys, (until,))
+        return self._invoices.get(bucket, [])[offset:min(offset + limit, total)], total
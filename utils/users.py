@@ -0,0 +1,81 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+USER_CACHE_SIZE = 2048  # fetched users kept for reuse
+USER_CACHE_TTL = 3600  # seconds a fetched user is reused before it is fetched again
+
+
+class UserResolver:
+    """Resolves user ids without a REST call where possible.
+
+    Order: the gateway cache (bot.get_user), then a TTL'd LRU of users this
+    resolver fetched, then bot.fetch_user. Concurrent misses for the same
+    id share one fetch, and failures are never cached.
+    """
+
+    def __init__(self, bot, maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.bot = bot
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._cache = OrderedDict()  # user id -> (expires at, user)
+        self._pending = {}  # user id -> in-flight fetch task
+        self.gateway_hits = 0
+        self.hits = 0
+        self.fetches = 0
+        self.coalesced = 0  # misses that joined an in-flight fetch
+        self.failures = 0
+
+    async def fetch_user(self, user_id):
+        user = self.bot.get_user(user_id)
+        if user is not None:
+            self.gateway_hits += 1
+            return user
+        entry = self._cache.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._cache.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+        task = self._pending.get(user_id)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.fetches += 1
+            task = self._pending[user_id] = asyncio.ensure_future(self.bot.fetch_user(user_id))
+            task.add_done_callback(lambda done: self._finish(user_id, done))
+        # Shielded so one caller being cancelled does not cancel the fetch the others wait on
+        return await asyncio.shield(task)
+
+    def _finish(self, user_id, task):
+        self._pending.pop(user_id, None)
+        if task.cancelled() or task.exception() is not None:
+            self.failures += 1
+            return
+        self._cache[user_id] = (time.monotonic() + self.ttl, task.result())
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def stats(self):
+        lookups = self.gateway_hits + self.hits + self.fetches + self.coalesced
+        return {
+            "gateway_hits": self.gateway_hits,
+            "hits": self.hits,
+            "fetches": self.fetches,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "size": len(self._cache),
+            "hit_rate": (lookups - self.fetches) / lookups if lookups else 0.0,
+        }
+
+
+_resolver = None
+
+
+def get_user_resolver(bot):
+    """Return the shared UserResolver, so every cog reuses the same cache."""
+    global _resolver
+    if _resolver is None:
+        _resolver = UserResolver(bot)
+    return _resolver